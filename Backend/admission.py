@@ -0,0 +1,124 @@
+# admission.py
+import math
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Iterator, Optional
+
+from flask import jsonify
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted (queue full or queue deadline passed) or served."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def overloaded_response(e: Overloaded):
+    """503 + Retry-After for a request refused with Overloaded."""
+    resp = jsonify({"error": "Server busy", "details": e.reason})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return resp
+
+
+class AdmissionController:
+    """
+    Bounded admission queue for the recognition endpoints.
+
+    At most `max_concurrent` requests run recognition at once; up to `max_queue`
+    more may wait for a slot, each for at most `deadline` seconds. Anything beyond
+    that is rejected immediately with Overloaded, which guard() turns into
+    503 + Retry-After, so a burst of camera traffic is shed instead of piling up
+    until clients time out and retry.
+
+    Usage:
+      admission = AdmissionController(max_concurrent=4, max_queue=16, deadline=5.0)
+
+      @app.route('/upload-base64', methods=['POST'])
+      @admission.guard
+      def upload_base64(): ...
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, deadline: float = 5.0,
+                 retry_after: float = 2.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.deadline = deadline
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self, deadline: Optional[float] = None) -> None:
+        deadline = self.deadline if deadline is None else deadline
+        with self._cond:
+            if self.in_flight < self.max_concurrent and self.waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("recognition queue full", self.retry_after)
+            self.waiting += 1
+            give_up = time.monotonic() + deadline
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded("queue deadline exceeded", self.retry_after)
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def guard(self, view):
+        """Flask view decorator: run `view` inside a slot, or answer 503 + Retry-After."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                self.acquire()
+            except Overloaded as e:
+                return overloaded_response(e)
+            try:
+                return view(*args, **kwargs)
+            except Overloaded as e:
+                # raised downstream, e.g. by RecognitionExecutor when a worker times out
+                return overloaded_response(e)
+            finally:
+                self.release()
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
@@ -0,0 +1,208 @@
+# ann_index.py
+import logging
+import math
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def kmeans(data: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means (k-means++ seeding) in numpy. Returns (k, dim) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(data)
+    k = max(1, min(k, n))
+
+    # k-means++ seeding
+    centroids = np.empty((k, data.shape[1]), dtype=np.float32)
+    centroids[0] = data[rng.integers(n)]
+    closest = np.einsum("ij,ij->i", data - centroids[0], data - centroids[0]).astype(np.float64)
+    for c in range(1, k):
+        total = closest.sum()
+        idx = rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)
+        centroids[c] = data[idx]
+        diff = data - centroids[c]
+        closest = np.minimum(closest, np.einsum("ij,ij->i", diff, diff))
+
+    data_sq = np.einsum("ij,ij->i", data, data)
+    for _ in range(iters):
+        assign = _nearest(data, data_sq, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centroids
+
+
+def _nearest(data: np.ndarray, data_sq: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for every row, via |a|^2 - 2ab + |b|^2 in one matmul."""
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    d = data_sq[:, None] - 2.0 * (data @ centroids.T) + c_sq[None, :]
+    return np.argmin(d, axis=1).astype(np.int32)
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index over FaceGallery rows.
+
+    The gallery rows are partitioned into `nlist` k-means cells. A query only scans
+    the rows of the `nprobe` cells whose centroids are closest, so cost scales with
+    N * nprobe / nlist instead of N. Higher nprobe -> better recall, slower search.
+
+    The index stores row numbers only (the vectors stay in the gallery matrix) and is
+    kept in sync through the gallery's on_add/on_move/on_remove/on_clear hooks:
+      - new rows are assigned to their nearest existing centroid (incremental)
+      - centroids are retrained when the gallery has grown by `retrain_growth` since
+        the last training, or when it first reaches `min_train_size`
+      - below `min_train_size` the index is untrained and the gallery searches exactly
+
+    Usage:
+      gallery = FaceGallery()
+      gallery.attach_index(IVFIndex(nprobe=8))
+      gallery.search(query, tolerance=0.6)
+    """
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, min_train_size: int = 1024,
+                 retrain_growth: float = 2.0, kmeans_iters: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+
+        self.gallery = None
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        # per-cell row arrays (growable) and their fill counts
+        self._lists: List[np.ndarray] = []
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        # row -> cell and row -> position inside that cell's array
+        self._cell = np.full(0, -1, dtype=np.int32)
+        self._pos = np.zeros(0, dtype=np.int64)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # --- gallery hooks -------------------------------------------------------------
+
+    def on_attach(self, gallery) -> None:
+        self.gallery = gallery
+        self.train()
+
+    def on_clear(self) -> None:
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = []
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        self._cell = np.full(0, -1, dtype=np.int32)
+
+    def on_add(self, start: int, stop: int) -> None:
+        size = len(self.gallery)
+        if (not self.trained and size >= self.min_train_size) or \
+                (self.trained and size >= self.trained_size * self.retrain_growth):
+            self.train()
+            return
+        if not self.trained:
+            return
+        rows = np.arange(start, stop)
+        vecs = self.gallery.matrix[start:stop]
+        cells = _nearest(vecs, np.einsum("ij,ij->i", vecs, vecs), self.centroids)
+        for row, cell in zip(rows, cells):
+            self._insert(int(row), int(cell))
+
+    def on_move(self, src: int, dst: int) -> None:
+        """Row `src` was copied to `dst` (swap-remove in the gallery)."""
+        if not self.trained:
+            return
+        cell = self._cell[src]
+        pos = self._pos[src]
+        self._lists[cell][pos] = dst
+        self._cell[dst] = cell
+        self._pos[dst] = pos
+        self._cell[src] = -1
+
+    def on_remove(self, row: int) -> None:
+        """Row `row` is being dropped (called before any move into it)."""
+        if not self.trained:
+            return
+        cell = self._cell[row]
+        if cell < 0:
+            return
+        pos = self._pos[row]
+        last = self._list_sizes[cell] - 1
+        moved = self._lists[cell][last]
+        self._lists[cell][pos] = moved
+        self._pos[moved] = pos
+        self._list_sizes[cell] = last
+        self._cell[row] = -1
+
+    # --- training / search ---------------------------------------------------------
+
+    def train(self) -> None:
+        """(Re)build centroids from the current gallery and reassign every row."""
+        size = len(self.gallery) if self.gallery is not None else 0
+        if size < self.min_train_size:
+            self.on_clear()
+            return
+        data = self.gallery.matrix
+        nlist = self.nlist or int(math.sqrt(size))
+        nlist = max(1, min(nlist, size))
+        rng = np.random.default_rng(self.seed)
+        # train on a sample; assignment below still covers every row
+        sample = data if size <= nlist * 64 else data[rng.choice(size, nlist * 64, replace=False)]
+        self.centroids = kmeans(sample, nlist, iters=self.kmeans_iters, seed=self.seed)
+        self.trained_size = size
+
+        cells = _nearest(data, np.einsum("ij,ij->i", data, data), self.centroids)
+        self._cell = np.full(size, -1, dtype=np.int32)
+        self._pos = np.zeros(size, dtype=np.int64)
+        self._cell[:size] = cells
+        order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=len(self.centroids))
+        self._list_sizes = counts.astype(np.int64)
+        self._lists = []
+        offset = 0
+        for c, count in enumerate(counts):
+            rows = order[offset:offset + count]
+            arr = np.empty(max(16, 2 * count), dtype=np.int64)
+            arr[:count] = rows
+            self._lists.append(arr)
+            self._pos[rows] = np.arange(count)
+            offset += count
+        logger.info("IVF index trained: %d rows, %d cells", size, len(self.centroids))
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        """Row numbers to scan for `query`, or None when the index is untrained (search exactly)."""
+        if not self.trained:
+            return None
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        diff = self.centroids - query
+        cd = np.einsum("ij,ij->i", diff, diff)
+        if nprobe < len(cd):
+            probe = np.argpartition(cd, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(len(cd))
+        return np.concatenate([self._lists[c][:self._list_sizes[c]] for c in probe])
+
+    def _insert(self, row: int, cell: int) -> None:
+        if row >= len(self._cell):
+            cap = max(row + 1, 2 * len(self._cell))
+            cell_arr = np.full(cap, -1, dtype=np.int32)
+            cell_arr[:len(self._cell)] = self._cell
+            pos_arr = np.zeros(cap, dtype=np.int64)
+            pos_arr[:len(self._pos)] = self._pos
+            self._cell, self._pos = cell_arr, pos_arr
+        size = self._list_sizes[cell]
+        arr = self._lists[cell]
+        if size >= len(arr):
+            grown = np.empty(2 * len(arr), dtype=np.int64)
+            grown[:size] = arr[:size]
+            self._lists[cell] = arr = grown
+        arr[size] = row
+        self._list_sizes[cell] = size + 1
+        self._cell[row] = cell
+        self._pos[row] = size
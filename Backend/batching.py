@@ -0,0 +1,124 @@
+# batching.py
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MatchBatcher:
+    """
+    Micro-batching stage in front of FaceMatcher's gallery matching.
+
+    Request threads call match(encoding); a single batcher thread collects the
+    requests that arrive within `window_ms` of the first one (up to `max_batch`),
+    computes all their gallery distances with one matrix product
+    (FaceMatcher.match_encodings) and hands each request its own result.
+
+    Larger windows give bigger batches (better throughput under load) at the cost of
+    up to `window_ms` extra latency per request. stats() reports batch sizes and
+    queue waits for tuning.
+
+    Usage:
+      batcher = MatchBatcher(face_manager, window_ms=3, max_batch=16)
+      matches = batcher.match(query_enc, tolerance=0.6, top_k=1)
+    """
+
+    def __init__(self, matcher, window_ms: float = 3.0, max_batch: int = 16, history: int = 1024):
+        self.matcher = matcher
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Tuple[np.ndarray, float, int, float, Future]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # metrics
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.size_counts: Dict[int, int] = {}
+        self._waits = deque(maxlen=history)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="match-batcher", daemon=True)
+                self._thread.start()
+
+    def match(self, query_enc: np.ndarray, tolerance: float = 0.6, top_k: int = 1,
+              timeout: float = 10.0) -> List[Tuple[str, float]]:
+        """Queue one encoding for the next batch and wait for its matches."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((np.asarray(query_enc, dtype=np.float32), tolerance, top_k, time.perf_counter(), fut))
+        return fut.result(timeout=timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                # requests with different tolerances are grouped and matched separately
+                groups: Dict[float, list] = {}
+                for item in batch:
+                    groups.setdefault(item[1], []).append(item)
+                for tolerance, items in groups.items():
+                    queries = np.stack([it[0] for it in items])
+                    results = self.matcher.match_encodings(queries, tolerance=tolerance,
+                                                           top_k=[it[2] for it in items])
+                    for it, res in zip(items, results):
+                        it[4].set_result(res)
+            except Exception as e:
+                logger.exception("Batch matching failed")
+                for it in batch:
+                    if not it[4].done():
+                        it[4].set_exception(e)
+            self._record(batch, started)
+
+    def _record(self, batch: list, started: float) -> None:
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.size_counts[len(batch)] = self.size_counts.get(len(batch), 0) + 1
+            for it in batch:
+                self._waits.append(started - it[3])
+
+    def stats(self) -> dict:
+        """Batch-size distribution and queue-wait percentiles (ms) over recent requests."""
+        with self._stats_lock:
+            waits = np.array(self._waits) * 1000.0 if self._waits else np.zeros(1)
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.size_counts.items())),
+                "queue_depth": self._queue.qsize(),
+                "queue_wait_ms": {
+                    "p50": float(np.percentile(waits, 50)),
+                    "p95": float(np.percentile(waits, 95)),
+                    "max": float(waits.max()),
+                },
+            }
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Recall / latency benchmark: IVF approximate search vs exact gallery search.
+
+Builds a synthetic gallery of face-like 128-d encodings (one cluster per identity),
+then queries it with noisy copies of enrolled faces and reports, per nprobe:
+  - recall@1: fraction of queries where the IVF answer equals the exact answer
+  - mean / p50 / p95 latency per query (ms), and the speed-up over exact
+
+Usage (from Backend/):
+  python benchmarks/ann_benchmark.py --sizes 1000 10000 --nprobe 1 4 8 16 32
+  python benchmarks/ann_benchmark.py --sizes 5000 --json ann_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gallery import FaceGallery  # noqa: E402
+from ann_index import IVFIndex  # noqa: E402
+
+
+def synthetic_gallery(n_identities: int, per_identity: int, seed: int = 0):
+    """
+    Identity centres spread like real dlib encodings (different people ~0.8-1.0 apart),
+    each enrolled encoding ~0.3 from its centre (same person well under 0.6).
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0.0, 0.06, (n_identities, 128)).astype(np.float32)
+    encs = centres[:, None, :] + rng.normal(0.0, 0.02, (n_identities, per_identity, 128)).astype(np.float32)
+    return centres, encs
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def time_queries(gallery, queries, tolerance, **kwargs):
+    results, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hit = gallery.search(q, tolerance=tolerance, top_k=1, **kwargs)
+        lat.append(time.perf_counter() - t0)
+        results.append(hit[0][0] if hit else None)
+    return results, np.array(lat)
+
+
+def run(size, per_identity, nprobes, n_queries, tolerance, nlist, seed):
+    centres, encs = synthetic_gallery(size, per_identity, seed)
+    rng = np.random.default_rng(seed + 1)
+
+    gallery = FaceGallery(capacity=size * per_identity)
+    for i in range(size):
+        gallery.add(f"id{i}", encs[i])
+
+    index = IVFIndex(nlist=nlist, min_train_size=1)
+    t0 = time.perf_counter()
+    gallery.attach_index(index)
+    build_s = time.perf_counter() - t0
+
+    picks = rng.integers(size, size=n_queries)
+    queries = centres[picks] + rng.normal(0.0, 0.02, (n_queries, 128)).astype(np.float32)
+
+    exact, exact_lat = time_queries(gallery, queries, tolerance, exact=True)
+    report = {
+        "size": size,
+        "rows": len(gallery),
+        "nlist": len(index.centroids),
+        "build_ms": build_s * 1000.0,
+        "exact": {
+            "mean_ms": float(exact_lat.mean() * 1000.0),
+            "p50_ms": percentile_ms(exact_lat, 50),
+            "p95_ms": percentile_ms(exact_lat, 95),
+        },
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        approx, lat = time_queries(gallery, queries, tolerance, nprobe=nprobe)
+        recall = float(np.mean([a == e for a, e in zip(approx, exact)]))
+        report["ivf"].append({
+            "nprobe": nprobe,
+            "recall_at_1": recall,
+            "mean_ms": float(lat.mean() * 1000.0),
+            "p50_ms": percentile_ms(lat, 50),
+            "p95_ms": percentile_ms(lat, 95),
+            "speedup": float(exact_lat.mean() / lat.mean()),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="number of identities")
+    parser.add_argument("--per-identity", type=int, default=1, help="encodings per identity")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default sqrt(rows))")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    reports = []
+    for size in args.sizes:
+        r = run(size, args.per_identity, args.nprobe, args.queries, args.tolerance, args.nlist, args.seed)
+        reports.append(r)
+        print(f"\nN={r['size']} rows={r['rows']} nlist={r['nlist']} build={r['build_ms']:.1f}ms")
+        print(f"  exact        mean={r['exact']['mean_ms']:.3f}ms p95={r['exact']['p95_ms']:.3f}ms")
+        for row in r["ivf"]:
+            print(f"  nprobe={row['nprobe']:<4} recall@1={row['recall_at_1']:.3f} "
+                  f"mean={row['mean_ms']:.3f}ms p95={row['p95_ms']:.3f}ms x{row['speedup']:.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Accuracy / load-time benchmark for the quantized embedding store (embeddings.py).
+
+Quantizes a gallery of 128-d encodings (synthetic, or real ones from an encoding
+cache .npz) and compares recognition against the float64 originals:
+  - bytes per stored encoding
+  - reconstruction error (max / mean absolute, per component)
+  - query-to-gallery distance error (mean / max absolute)
+  - top-1 agreement: fraction of queries whose best identity matches float64's
+  - decision flips: queries whose "match within tolerance" answer changes
+  - time to bulk-load the gallery from SQLite (EmbeddingStore.load + FaceGallery.load)
+
+Usage (from Backend/):
+  python benchmarks/quantization_benchmark.py --sizes 1000 10000
+  python benchmarks/quantization_benchmark.py --cache faces.cache.npz --json quant_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_benchmark import synthetic_gallery  # noqa: E402
+from embeddings import DTYPES, EmbeddingStore, dequantize, quantize  # noqa: E402
+from encoding_cache import EncodingCache  # noqa: E402
+from gallery import FaceGallery  # noqa: E402
+from sqliteDB import SqliteDB  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+
+def all_distances(matrix, queries):
+    q_sq = (queries ** 2).sum(axis=1)[:, None]
+    m_sq = (matrix ** 2).sum(axis=1)[None, :]
+    return np.sqrt(np.maximum(q_sq - 2.0 * queries @ matrix.T + m_sq, 0.0))
+
+
+def load_time(encodings, labels, dtype, workdir):
+    """Write the gallery to a fresh SQLite store and time one bulk load into a FaceGallery."""
+    db = SqliteDB(os.path.join(workdir, f"quant-{dtype}-{len(labels)}.db"))
+    db.migrate(MIGRATIONS_DIR)
+    store = EmbeddingStore(db, dtype=dtype)
+    now = datetime.now()
+    with db.transaction():
+        db.executemany("INSERT INTO users (id, name, created_at) VALUES (?, ?, ?)",
+                       [(i + 1, name, now) for i, name in enumerate(sorted(set(labels)))])
+        ids = {name: i + 1 for i, name in enumerate(sorted(set(labels)))}
+        rows = quantize(encodings, dtype)
+        db.executemany("INSERT INTO face_embeddings (user_id, dtype, scale, vector) VALUES (?, ?, ?, ?)",
+                       [(ids[name], dtype, scale, blob) for name, (scale, blob) in zip(labels, rows)])
+    db.close_all()
+
+    t0 = time.perf_counter()
+    names, matrix = store.load()
+    gallery = FaceGallery()
+    gallery.load(matrix, names)
+    elapsed = time.perf_counter() - t0
+    db.close_all()
+    return elapsed * 1000.0, os.path.getsize(db.database)
+
+
+def run(encodings, labels, queries, tolerance, workdir):
+    reference = np.asarray(encodings, dtype=np.float64)
+    queries = np.asarray(queries, dtype=np.float64)
+    ref_d = all_distances(reference, queries)
+    ref_best = ref_d.argmin(axis=1)
+    ref_label = [labels[i] for i in ref_best]
+    ref_match = ref_d.min(axis=1) <= tolerance
+
+    report = {"rows": len(reference), "identities": len(set(labels)), "queries": len(queries),
+              "tolerance": tolerance, "dtypes": []}
+    for dtype in DTYPES:
+        rows = quantize(reference, dtype)
+        restored = dequantize([blob for _, blob in rows], np.array([s for s, _ in rows]), dtype).astype(np.float64)
+        err = np.abs(restored - reference)
+        d = all_distances(restored, queries)
+        best = d.argmin(axis=1)
+        label = [labels[i] for i in best]
+        match = d.min(axis=1) <= tolerance
+        d_err = np.abs(d - ref_d)
+        load_ms, db_bytes = load_time(reference, labels, dtype, workdir)
+        report["dtypes"].append({
+            "dtype": dtype,
+            "bytes_per_encoding": len(rows[0][1]) if rows else 0,
+            "component_err_max": float(err.max()),
+            "component_err_mean": float(err.mean()),
+            "distance_err_mean": float(d_err.mean()),
+            "distance_err_max": float(d_err.max()),
+            "top1_agreement": float(np.mean([a == b for a, b in zip(label, ref_label)])),
+            "decision_flips": int((match != ref_match).sum()),
+            "load_ms": load_ms,
+            "db_bytes": db_bytes,
+        })
+    return report
+
+
+def cached_encodings(path):
+    cache = EncodingCache(path)
+    cache.load()
+    encodings, labels = [], []
+    for name, entry in cache.entries.items():
+        for enc in entry.encodings:
+            encodings.append(enc)
+            labels.append(os.path.splitext(name)[0])
+    return np.array(encodings, dtype=np.float64).reshape(-1, 128), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="synthetic identities")
+    parser.add_argument("--per-identity", type=int, default=1, help="encodings per synthetic identity")
+    parser.add_argument("--cache", help="use the real encodings in this encoding cache (.npz) instead")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.03, help="query noise (std per component)")
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed + 1)
+    datasets = []
+    if args.cache:
+        encodings, labels = cached_encodings(args.cache)
+        datasets.append((f"cache:{args.cache}", encodings, labels))
+    else:
+        for size in args.sizes:
+            _, encs = synthetic_gallery(size, args.per_identity, args.seed)
+            labels = [f"id{i}" for i in range(size) for _ in range(args.per_identity)]
+            datasets.append((f"synthetic:{size}", encs.reshape(-1, 128).astype(np.float64), labels))
+
+    reports = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, encodings, labels in datasets:
+            if len(encodings) == 0:
+                print(f"\n{name}: no encodings")
+                continue
+            picks = rng.integers(len(encodings), size=args.queries)
+            queries = encodings[picks] + rng.normal(0.0, args.noise, (args.queries, 128))
+            r = run(encodings, labels, queries, args.tolerance, workdir)
+            r["dataset"] = name
+            reports.append(r)
+            print(f"\n{name} rows={r['rows']} identities={r['identities']} queries={r['queries']} (vs float64)")
+            for row in r["dtypes"]:
+                print(f"  {row['dtype']:<8} {row['bytes_per_encoding']:>4} B/enc  "
+                      f"comp err max={row['component_err_max']:.5f}  "
+                      f"dist err mean={row['distance_err_mean']:.5f} max={row['distance_err_max']:.5f}  "
+                      f"top1={row['top1_agreement']:.4f} flips={row['decision_flips']}  "
+                      f"load={row['load_ms']:.1f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
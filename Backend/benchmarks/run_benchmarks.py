@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the face and database hot paths.
+
+Runs against synthetic galleries of configurable size (random 128-d encodings
+added straight to the gallery) in a throwaway working directory, and reports
+latency percentiles and throughput for:
+
+  load_faces_from_folder   cold (no encoding cache) and warm (cache hit) reloads
+  detect_faces_b64         enrollment-side detection + encoding of one frame
+  search_image_b64         detection + encoding + gallery match, per gallery size
+  route /upload-base64     full request through the Flask test client
+  route /add-user          full enrollment request through the Flask test client
+  route /events            batched hydration-event ingestion (write-behind queue)
+  sqlite concurrent        SqliteDB.execute / fetchall with N writer threads
+
+Query frames come from --fixtures (a folder of real face photos, recommended) or,
+without it, synthetic images; synthetic frames contain no face, so they measure
+the "no face found" path, including the bounded upsample retry.
+
+Results go to a JSON file so runs can be compared over time.
+
+Usage (from Backend/):
+  python benchmarks/run_benchmarks.py --sizes 10 1000 10000 --out bench.json
+  python benchmarks/run_benchmarks.py --fixtures ~/faces-sample --only search routes
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import sqlite3
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BENCHES = ("load", "detect", "search", "routes", "sqlite")
+
+
+def summarize(samples, wall: float = None) -> dict:
+    """Latency percentiles (ms) and throughput (ops/s) for a list of per-op seconds."""
+    arr = np.asarray(samples, dtype=np.float64)
+    total = wall if wall is not None else float(arr.sum())
+    return {
+        "n": int(len(arr)),
+        "mean_ms": float(arr.mean() * 1000.0),
+        "p50_ms": float(np.percentile(arr, 50) * 1000.0),
+        "p95_ms": float(np.percentile(arr, 95) * 1000.0),
+        "p99_ms": float(np.percentile(arr, 99) * 1000.0),
+        "max_ms": float(arr.max() * 1000.0),
+        "throughput_per_s": float(len(arr) / total) if total > 0 else 0.0,
+    }
+
+
+def timed(fn, iterations: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def synthetic_jpeg(rng: np.random.Generator, width: int = 640, height: int = 480) -> bytes:
+    img = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(img).resize((width, height), Image.BILINEAR).save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+def load_frames(fixtures: str, rng: np.random.Generator, count: int = 8):
+    """Encoded JPEG/PNG bytes to use as query frames."""
+    frames = []
+    if fixtures:
+        for fname in sorted(os.listdir(fixtures)):
+            if fname.lower().endswith((".jpg", ".jpeg", ".png")):
+                with open(os.path.join(fixtures, fname), "rb") as f:
+                    frames.append(f.read())
+    if not frames:
+        frames = [synthetic_jpeg(rng) for _ in range(count)]
+    return frames
+
+
+def fill_gallery(matcher, size: int, rng: np.random.Generator) -> None:
+    encs = rng.normal(0.0, 0.06, (size, 128))
+    for i in range(size):
+        matcher.add_identity(f"bench-{i}", [encs[i]])
+
+
+def bench_load(args, rng, frames) -> dict:
+    from face import FaceMatcher
+
+    results = {}
+    sizes = [s for s in args.sizes if s <= args.folder_max]
+    for size in sizes:
+        faces_dir = os.path.join(args.workdir, f"faces-load-{size}")
+        os.makedirs(faces_dir, exist_ok=True)
+        for i in range(size):
+            with open(os.path.join(faces_dir, f"user-{i}.jpg"), "wb") as f:
+                f.write(frames[i % len(frames)])
+        cache_path = faces_dir + ".cache.npz"
+
+        matcher = FaceMatcher(faces_dir, cache_path="")
+        cold = timed(matcher.load_faces_from_folder, max(1, args.iterations // 10), warmup=0)
+
+        FaceMatcher(faces_dir, cache_path=cache_path)  # populate the cache
+        matcher = FaceMatcher(faces_dir, cache_path=cache_path)
+        warm = timed(matcher.load_faces_from_folder, args.iterations, warmup=0)
+        results[str(size)] = {"cold": cold, "warm": warm}
+        print(f"load_faces_from_folder N={size}: cold p50={cold['p50_ms']:.1f}ms warm p50={warm['p50_ms']:.1f}ms")
+    return results
+
+
+def bench_detect(args, rng, frames) -> dict:
+    from face import FaceMatcher
+
+    matcher = FaceMatcher(os.path.join(args.workdir, "faces-empty"), cache_path="")
+    payloads = [base64.b64encode(f).decode("ascii") for f in frames]
+    it = iter(range(10 ** 9))
+    res = timed(lambda: matcher.detect_faces_b64(payloads[next(it) % len(payloads)]), args.iterations)
+    print(f"detect_faces_b64: p50={res['p50_ms']:.1f}ms p95={res['p95_ms']:.1f}ms")
+    return res
+
+
+def bench_search(args, rng, frames) -> dict:
+    from face import FaceMatcher
+
+    payloads = [base64.b64encode(f).decode("ascii") for f in frames]
+    results = {}
+    for size in args.sizes:
+        matcher = FaceMatcher(os.path.join(args.workdir, "faces-empty"), cache_path="")
+        fill_gallery(matcher, size, rng)
+        it = iter(range(10 ** 9))
+        res = timed(lambda: matcher.search_image_b64(payloads[next(it) % len(payloads)]), args.iterations)
+
+        # matching alone, to separate gallery cost from detection/encoding cost
+        queries = rng.normal(0.0, 0.06, (64, 128))
+        qi = iter(range(10 ** 9))
+        match = timed(lambda: matcher.match_encoding(queries[next(qi) % 64]), args.iterations * 10)
+        results[str(size)] = {"search_image_b64": res, "match_encoding": match}
+        print(f"search_image_b64 N={size}: p50={res['p50_ms']:.1f}ms  match_encoding p50={match['p50_ms']:.3f}ms")
+    return results
+
+
+def bench_routes(args, rng, frames) -> dict:
+    # server.py migrates its database at import: point it at a temp one first, and
+    # skip the background warm-up so nothing reads the gallery behind the fill below
+    os.environ["SMARTHYDRATE_DATABASE"] = os.path.join(args.workdir, "bench.db")
+    os.environ["SMARTHYDRATE_WARMUP"] = "0"
+    import server
+
+    app = server.app
+    server.face_manager.load_gallery()
+    server.face_manager.load_models()
+    server.start_recognition()
+    client = app.test_client()
+    payloads = [base64.b64encode(f).decode("ascii") for f in frames]
+
+    # the frame gate and result cache would answer repeated frames without recognizing
+    # them; time the full pipeline unless --short-circuits is given
+    if not args.short_circuits:
+        server.frame_gate = None
+        server.recognition_cache = None
+
+    results = {}
+    for size in args.sizes:
+        server.face_manager.gallery.clear()
+        fill_gallery(server.face_manager, size, rng)
+        it = iter(range(10 ** 9))
+        upload = timed(lambda: client.post("/upload-base64",
+                                           json={"image": payloads[next(it) % len(payloads)]}),
+                       args.iterations)
+        results[f"upload-base64/{size}"] = upload
+        print(f"POST /upload-base64 N={size}: p50={upload['p50_ms']:.1f}ms p95={upload['p95_ms']:.1f}ms")
+
+    counter = iter(range(10 ** 9))
+    add = timed(lambda: client.post("/add-user", json={
+        "name": f"bench-user-{next(counter)}",
+        "daily_limit": 2.0,
+        "image": "data:image/jpeg;base64," + payloads[0],
+    }), args.iterations)
+    results["add-user"] = add
+    print(f"POST /add-user: p50={add['p50_ms']:.1f}ms p95={add['p95_ms']:.1f}ms")
+
+    # batched event ingestion; the write-behind flush is timed separately
+    with app.app_context():
+        user_ids = [u["id"] for u in server.db.fetchall("SELECT id FROM users")] or [1]
+    batch = [{"user_id": user_ids[i % len(user_ids)], "volume_ml": 150} for i in range(args.event_batch)]
+    events = timed(lambda: client.post("/events", json={"events": batch}), args.iterations)
+    t0 = time.perf_counter()
+    server.event_writer.flush()
+    flush = time.perf_counter() - t0
+    events["events_per_s"] = events["throughput_per_s"] * args.event_batch
+    events["final_flush_ms"] = flush * 1000.0
+    results[f"events/{args.event_batch}"] = events
+    print(f"POST /events x{args.event_batch}: p50={events['p50_ms']:.2f}ms "
+          f"({events['events_per_s']:.0f} events/s accepted)")
+    return results
+
+
+def bench_sqlite(args, rng, frames) -> dict:
+    from flask import Flask
+    from sqliteDB import SqliteDB
+
+    app = Flask("bench")
+    app.instance_path = args.workdir
+    db = SqliteDB("bench-sqlite.db")
+    db.init_app(app)
+    with app.app_context():
+        db.executescript("CREATE TABLE IF NOT EXISTS bench (id INTEGER PRIMARY KEY, user_id INTEGER, volume_ml REAL, ts TEXT);")
+
+    results = {}
+    for writers in args.writers:
+        samples, errors = [], []
+        lock = threading.Lock()
+
+        def writer(n):
+            local = []
+            with app.app_context():
+                for i in range(args.iterations):
+                    t0 = time.perf_counter()
+                    try:
+                        db.execute("INSERT INTO bench (user_id, volume_ml, ts) VALUES (?, ?, ?)",
+                                   (n, random.random() * 250, datetime.now().isoformat()))
+                        if i % 10 == 0:
+                            db.fetchall("SELECT * FROM bench WHERE user_id = ? ORDER BY id DESC LIMIT 10", (n,))
+                    except sqlite3.OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    local.append(time.perf_counter() - t0)
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        res = summarize(samples, wall) if samples else {"n": 0}
+        res["errors"] = len(errors)
+        results[str(writers)] = res
+        print(f"sqlite writers={writers}: p50={res.get('p50_ms', 0):.2f}ms "
+              f"throughput={res.get('throughput_per_s', 0):.0f}/s errors={len(errors)}")
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="gallery sizes (identities)")
+    parser.add_argument("--iterations", type=int, default=50, help="timed iterations per benchmark")
+    parser.add_argument("--folder-max", type=int, default=1000,
+                        help="largest size used for load_faces_from_folder (it writes real image files)")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 8], help="concurrent SQLite writer threads")
+    parser.add_argument("--event-batch", type=int, default=50, help="events per POST /events request")
+    parser.add_argument("--short-circuits", action="store_true",
+                        help="keep the frame gate and recognition cache enabled in route benchmarks")
+    parser.add_argument("--fixtures", help="folder of real face images to use as query frames")
+    parser.add_argument("--only", nargs="+", choices=BENCHES, default=list(BENCHES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    args.fixtures = os.path.abspath(args.fixtures) if args.fixtures else None
+    out_path = os.path.abspath(args.out)
+    frames = load_frames(args.fixtures, rng)
+
+    # everything the app writes (faces/, caches, databases, logs) stays in a temp dir
+    args.workdir = tempfile.mkdtemp(prefix="smarthydrate-bench-")
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "sizes": args.sizes,
+            "iterations": args.iterations,
+            "writers": args.writers,
+            "event_batch": args.event_batch,
+            "short_circuits": args.short_circuits,
+            "fixtures": bool(args.fixtures),
+            "frames": len(frames),
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    runners = {"load": bench_load, "detect": bench_detect, "search": bench_search,
+               "routes": bench_routes, "sqlite": bench_sqlite}
+    try:
+        for name in BENCHES:
+            if name in args.only:
+                report["results"][name] = runners[name](args, rng, frames)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    with open(out_path, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# debug_capture.py
+import os
+import queue
+import random
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DebugCapture:
+    """
+    Opt-in capture of request frames for debugging, kept off the request thread.
+
+    capture() only decides whether to keep a frame (enabled, sampling rate,
+    only-on-failure) and hands the bytes to a bounded queue; a background thread
+    writes them into a ring of `ring_size` files (frame_000.<ext> ... ) in
+    `directory`, overwriting the oldest. When the queue is full the frame is
+    dropped rather than blocking the request. Disabled, it does no I/O at all.
+
+    Usage:
+      capture = DebugCapture("Storage/debug", enabled=True, sample_rate=0.1, only_on_failure=True)
+      capture.capture(image.data, ext=image.ext, failed=not matches)
+    """
+
+    def __init__(self, directory: str, enabled: bool = False, ring_size: int = 20,
+                 sample_rate: float = 1.0, only_on_failure: bool = False, queue_size: int = 8):
+        self.directory = directory
+        self.enabled = enabled
+        self.ring_size = max(1, ring_size)
+        self.sample_rate = sample_rate
+        self.only_on_failure = only_on_failure
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._next_slot = 0
+        self._slot_paths: Dict[int, str] = {}
+        self.captured = 0
+        self.dropped = 0
+
+    def capture(self, data: bytes, ext: Optional[str] = None, failed: bool = False) -> bool:
+        """Queue `data` for writing if this frame is selected. Never blocks; returns True if queued."""
+        if not self.enabled or not data:
+            return False
+        if self.only_on_failure and not failed:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((data, ext or "bin"))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="debug-capture", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            data, ext = self._queue.get()
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.ring_size
+            path = os.path.join(self.directory, f"frame_{slot:03d}.{ext}")
+            try:
+                old = self._slot_paths.get(slot)
+                if old and old != path and os.path.exists(old):
+                    os.remove(old)
+                with open(path, "wb") as f:
+                    f.write(data)
+                self._slot_paths[slot] = path
+                self.captured += 1
+            except OSError:
+                logger.exception("Failed to write debug frame %s", path)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
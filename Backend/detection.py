@@ -0,0 +1,109 @@
+# detection.py
+import time
+import logging
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left), face_recognition order
+
+
+class DetectionConfig:
+    """
+    Tunables for the face detection pipeline shared by enrollment and search.
+
+      - max_side: HOG runs on a copy whose longest side is at most this many pixels
+        (0 disables downscaling). Boxes are mapped back to the full-resolution frame,
+        so encodings are still computed on the original pixels.
+      - upsample: HOG upsample count for the first pass.
+      - fallback_upsample: highest upsample count tried when the first pass finds nothing
+        (set equal to `upsample` to disable the retry).
+      - fallback_max_pixels: skip a retry whose upsampled image would exceed this many
+        pixels (each upsample step is 4x the pixels).
+      - fallback_time_budget: skip further retries once detection has already taken
+        this many seconds.
+    """
+
+    def __init__(self, max_side: int = 640, upsample: int = 1, fallback_upsample: int = 2,
+                 fallback_max_pixels: int = 1280 * 960 * 4, fallback_time_budget: float = 0.25,
+                 model: str = "hog"):
+        self.max_side = max_side
+        self.upsample = upsample
+        self.fallback_upsample = fallback_upsample
+        self.fallback_max_pixels = fallback_max_pixels
+        self.fallback_time_budget = fallback_time_budget
+        self.model = model
+
+    def fingerprint(self) -> str:
+        """Every setting that can change which faces are found, e.g. to key cached encodings."""
+        return (f"model={self.model} max_side={self.max_side} upsample={self.upsample} "
+                f"fallback_upsample={self.fallback_upsample} fallback_max_pixels={self.fallback_max_pixels} "
+                f"fallback_time_budget={self.fallback_time_budget}")
+
+
+def load_models() -> None:
+    """
+    Import face_recognition now. The import loads dlib and its model files (seconds),
+    so modules import it lazily at first use and the server calls this while warming up.
+    """
+    import face_recognition  # noqa: F401
+
+
+def downscale(rgb: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """Return (image, scale) where image is `rgb` shrunk so its longest side <= max_side."""
+    h, w = rgb.shape[:2]
+    longest = max(h, w)
+    if not max_side or longest <= max_side:
+        return rgb, 1.0
+    scale = max_side / float(longest)
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    small = Image.fromarray(rgb).resize(size, Image.BILINEAR)
+    return np.array(small), scale
+
+
+def scale_boxes(boxes: List[Box], scale: float, shape: Tuple[int, ...]) -> List[Box]:
+    """Map boxes found on a downscaled copy back to the full-resolution frame."""
+    if scale == 1.0:
+        return list(boxes)
+    h, w = shape[:2]
+    out = []
+    for top, right, bottom, left in boxes:
+        out.append((
+            max(0, int(round(top / scale))),
+            min(w, int(round(right / scale))),
+            min(h, int(round(bottom / scale))),
+            max(0, int(round(left / scale))),
+        ))
+    return out
+
+
+def detect_faces(rgb: np.ndarray, config: DetectionConfig) -> List[Box]:
+    """
+    Find face boxes in `rgb` (full-resolution coordinates).
+    HOG runs on a downscaled copy; the upsampling retry is bounded by the pixel and
+    time budgets in `config` so a frame with no face cannot take unbounded time.
+    """
+    start = time.perf_counter()
+    small, scale = downscale(rgb, config.max_side)
+    sh, sw = small.shape[:2]
+
+    import face_recognition
+    locations = face_recognition.face_locations(small, number_of_times_to_upsample=config.upsample,
+                                                model=config.model)
+    upsample = config.upsample
+    while not locations and upsample < config.fallback_upsample:
+        upsample += 1
+        if sh * sw * (4 ** upsample) > config.fallback_max_pixels:
+            logger.debug("skipping upsample=%d retry: over pixel budget", upsample)
+            break
+        if time.perf_counter() - start > config.fallback_time_budget:
+            logger.debug("skipping upsample=%d retry: over time budget", upsample)
+            break
+        locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample,
+                                                    model=config.model)
+        logger.debug("after upsample=%d, face_locations found: %s", upsample, locations)
+
+    return scale_boxes(locations, scale, rgb.shape)
@@ -0,0 +1,139 @@
+# embeddings.py
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from gallery import ENCODING_DIM
+
+DTYPES = ("int8", "float16")
+
+
+def quantize(encodings: Iterable[np.ndarray], dtype: str = "int8") -> List[Tuple[float, bytes]]:
+    """
+    Encode each vector as (scale, blob).
+      - int8: symmetric per-vector scale, q = round(v / scale) with scale = max|v| / 127
+        (128 bytes + one float per encoding)
+      - float16: the vector as half floats, scale 1.0 (256 bytes)
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype!r} (expected one of {DTYPES})")
+    encs = np.asarray(list(encodings), dtype=np.float64).reshape(-1, ENCODING_DIM)
+    if dtype == "float16":
+        return [(1.0, row.astype("<f2").tobytes()) for row in encs]
+    scales = np.abs(encs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(encs / scales[:, None]), -127, 127).astype(np.int8)
+    return [(float(s), row.tobytes()) for s, row in zip(scales, q)]
+
+
+def dequantize(blobs: List[bytes], scales: np.ndarray, dtype: str) -> np.ndarray:
+    """Inverse of quantize() for many rows of one dtype: (N, 128) float32."""
+    if not blobs:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+    raw = np.frombuffer(b"".join(blobs), dtype="<f2" if dtype == "float16" else np.int8)
+    matrix = raw.reshape(-1, ENCODING_DIM).astype(np.float32)
+    if dtype == "int8":
+        matrix *= np.asarray(scales, dtype=np.float32)[:, None]
+    return matrix
+
+
+class EmbeddingStore:
+    """
+    Face encodings persisted per user in the face_embeddings table (migration 004).
+
+    Encodings are written quantized (`dtype` "int8" or "float16", see quantize()) in
+    the same transaction as the user they belong to, and load() reads the whole
+    gallery back with one query into one (N, 128) matrix, so a restart does not
+    decode or re-encode any image. Rows are labelled with the user's name, which is
+    what recognition returns; when a name was enrolled more than once the newest
+    user wins, as in event ingestion.
+
+    Accuracy vs the float64 encodings: benchmarks/quantization_benchmark.py.
+
+    Usage:
+      store = EmbeddingStore(db, dtype="int8")
+      with db.transaction():
+          user_id = db.execute("INSERT INTO users ...").lastrowid
+          store.save(user_id, encodings)
+      names, matrix = store.load()
+    """
+
+    LOAD_QUERY = """
+        SELECT u.name, e.dtype, e.scale, e.vector
+        FROM face_embeddings e
+        JOIN users u ON u.id = e.user_id
+        WHERE u.id IN (SELECT MAX(id) FROM users GROUP BY name)
+        ORDER BY e.user_id, e.id
+    """
+
+    def __init__(self, db, dtype: str = "int8"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding dtype: {dtype!r} (expected one of {DTYPES})")
+        self.db = db
+        self.dtype = dtype
+
+    def save(self, user_id: int, encodings: Iterable[np.ndarray], image_path: Optional[str] = None) -> int:
+        """
+        Replace the stored encodings of `user_id` (and its image_path, if given).
+        Joins the caller's transaction if there is one. Returns the rows written.
+        """
+        rows = quantize(encodings, self.dtype)
+        now = datetime.now()
+        with self.db.transaction():
+            self.db.execute("DELETE FROM face_embeddings WHERE user_id = ?", (user_id,))
+            if rows:
+                self.db.executemany(
+                    "INSERT INTO face_embeddings (user_id, dtype, scale, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, self.dtype, scale, blob, now) for scale, blob in rows],
+                )
+            if image_path is not None:
+                self.db.execute("UPDATE users SET image_path = ? WHERE id = ?", (image_path, user_id))
+        return len(rows)
+
+    def as_stored(self, encodings: Iterable[np.ndarray]) -> np.ndarray:
+        """`encodings` as load() will return them, so a live gallery matches a reloaded one."""
+        rows = quantize(encodings, self.dtype)
+        return dequantize([blob for _, blob in rows], np.array([scale for scale, _ in rows]), self.dtype)
+
+    def load(self) -> Tuple[List[str], np.ndarray]:
+        """Return (names, (N, 128) float32 matrix) for every stored encoding, in one query."""
+        rows = self.db.execute(self.LOAD_QUERY).fetchall()
+        return [row[0] for row in rows], self._decode([row[1:] for row in rows])
+
+    def load_name(self, name: str) -> Optional[np.ndarray]:
+        """
+        The stored encodings of the newest user called `name` (as load() would label
+        them), or None when no user has that name any more.
+        """
+        user = self.db.fetchone("SELECT MAX(id) AS id FROM users WHERE name = ?", (name,))
+        if user is None or user["id"] is None:
+            return None
+        rows = self.db.execute(
+            "SELECT dtype, scale, vector FROM face_embeddings WHERE user_id = ? ORDER BY id", (user["id"],)
+        ).fetchall()
+        return self._decode(rows)
+
+    @staticmethod
+    def _decode(rows) -> np.ndarray:
+        """(dtype, scale, vector) rows -> (N, 128) float32 matrix."""
+        matrix = np.empty((len(rows), ENCODING_DIM), dtype=np.float32)
+        dtypes = np.array([row[0] for row in rows], dtype=object)
+        scales = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        # normally all one dtype; rows written before a dtype change are decoded separately
+        for dtype in set(dtypes):
+            idx = np.flatnonzero(dtypes == dtype)
+            matrix[idx] = dequantize([rows[i][2] for i in idx], scales[idx], dtype)
+        return matrix
+
+    def missing(self) -> List[dict]:
+        """Users (newest per name) without stored encodings, e.g. enrolled before this table existed."""
+        return self.db.fetchall(
+            "SELECT u.id, u.name, u.image_path FROM users u "
+            "WHERE u.id IN (SELECT MAX(id) FROM users GROUP BY name) "
+            "AND NOT EXISTS (SELECT 1 FROM face_embeddings e WHERE e.user_id = u.id) "
+            "ORDER BY u.id"
+        )
+
+    def count(self) -> int:
+        return self.db.fetchone("SELECT COUNT(*) AS n FROM face_embeddings")["n"]
@@ -0,0 +1,166 @@
+# encoding_cache.py
+import os
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the hex sha1 of a file's content."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ("size", "mtime_ns", "digest", "encodings")
+
+    def __init__(self, size: int, mtime_ns: int, digest: str, encodings: np.ndarray):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+        # (k, 128) array; k == 0 means "decoded fine but no face found"
+        self.encodings = encodings
+
+
+class EncodingCache:
+    """
+    Persistent on-disk cache of face encodings, keyed by file name.
+
+    Each entry remembers the file's size, mtime and sha1 so a reload can tell
+    whether an image must be re-encoded:
+      - size and mtime unchanged  -> reuse without reading the file
+      - size/mtime changed but same sha1 (e.g. touched/copied) -> reuse, refresh stat
+      - otherwise -> caller re-encodes and calls put()
+
+    The cache is stored as a single .npz file (written atomically via a temp file
+    and os.replace) so a warm restart is one file read. The file records the
+    `fingerprint` of the settings the encodings were computed with (see
+    DetectionConfig.fingerprint()); a file written with another fingerprint is
+    discarded on load, so changed detection settings re-encode every image.
+    fingerprint=None accepts any file (read-only uses such as the benchmarks).
+
+    Usage:
+      cache = EncodingCache("faces.cache.npz", fingerprint=detection.fingerprint())
+      cache.load()
+      encs = cache.lookup("alice.jpg", "/path/faces/alice.jpg", os.stat(path))
+      if encs is None:
+          encs = expensive_encode(path)
+          cache.put("alice.jpg", os.stat(path), digest, encs)
+      cache.prune(current_names)
+      cache.save()
+    """
+
+    def __init__(self, path: str, fingerprint: Optional[str] = None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, CacheEntry] = {}
+        self.dirty = False
+
+    def load(self) -> None:
+        """Read the cache file if it exists; a missing or corrupt file yields an empty cache."""
+        self.entries.clear()
+        self.dirty = False
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                fingerprint = str(data["fingerprint"]) if "fingerprint" in data.files else ""
+                if self.fingerprint is None:
+                    self.fingerprint = fingerprint
+                elif fingerprint != self.fingerprint:
+                    logger.info("Encoding cache %s was built with other detection settings, starting empty", self.path)
+                    # rewrite it on the next save even if nothing is re-encoded
+                    self.dirty = True
+                    return
+                names = data["names"]
+                sizes = data["sizes"]
+                mtimes = data["mtimes"]
+                digests = data["digests"]
+                counts = data["counts"]
+                encodings = data["encodings"]
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+            for i, name in enumerate(names):
+                encs = encodings[offsets[i]:offsets[i + 1]]
+                self.entries[str(name)] = CacheEntry(int(sizes[i]), int(mtimes[i]), str(digests[i]), encs)
+        except Exception:
+            logger.exception("Failed to read encoding cache %s, starting empty", self.path)
+            self.entries.clear()
+
+    def save(self) -> None:
+        """Write the cache to disk if anything changed since load()."""
+        if not self.dirty:
+            return
+        names = list(self.entries.keys())
+        entries = [self.entries[n] for n in names]
+        counts = np.array([len(e.encodings) for e in entries], dtype=np.int64)
+        if entries and counts.sum() > 0:
+            encodings = np.concatenate([e.encodings for e in entries if len(e.encodings)]).astype(np.float64)
+        else:
+            encodings = np.empty((0, ENCODING_DIM), dtype=np.float64)
+
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    fingerprint=np.array(self.fingerprint or "", dtype=str),
+                    names=np.array(names, dtype=str),
+                    sizes=np.array([e.size for e in entries], dtype=np.int64),
+                    mtimes=np.array([e.mtime_ns for e in entries], dtype=np.int64),
+                    digests=np.array([e.digest for e in entries], dtype=str),
+                    counts=counts,
+                    encodings=encodings,
+                )
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except Exception:
+            logger.exception("Failed to write encoding cache %s", self.path)
+
+    def lookup(self, name: str, path: str, st: os.stat_result) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """
+        Return (encodings, digest) for `name` if the cached entry is still valid.
+        On a miss returns (None, digest) where digest is the freshly computed sha1
+        (or None when the stat matched nothing and hashing was not needed).
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return None, None
+        if entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return entry.encodings, entry.digest
+
+        # stat changed: only re-encode if the content actually changed
+        digest = file_digest(path)
+        if digest == entry.digest:
+            entry.size = st.st_size
+            entry.mtime_ns = st.st_mtime_ns
+            self.dirty = True
+            return entry.encodings, digest
+        return None, digest
+
+    def put(self, name: str, st: os.stat_result, digest: Optional[str], encodings: List[np.ndarray], path: Optional[str] = None) -> None:
+        """Store encodings for `name`. Computes the digest from `path` when not given."""
+        if digest is None:
+            digest = file_digest(path) if path else ""
+        arr = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        self.entries[name] = CacheEntry(st.st_size, st.st_mtime_ns, digest, arr)
+        self.dirty = True
+
+    def prune(self, keep_names) -> int:
+        """Drop entries whose file no longer exists. Returns the number removed."""
+        keep = set(keep_names)
+        stale = [n for n in self.entries if n not in keep]
+        for n in stale:
+            del self.entries[n]
+        if stale:
+            self.dirty = True
+        return len(stale)
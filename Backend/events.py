@@ -0,0 +1,277 @@
+# events.py
+import math
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from admission import Overloaded
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# (user_id, name, volume_ml, timestamp, device_id); exactly one of user_id / name is set
+HydrationEvent = Tuple[Optional[int], Optional[str], float, datetime, Optional[str]]
+
+MAX_VOLUME_ML = 5000.0
+
+_TIMESTAMP_ERROR = "'timestamp' must be ISO 8601 or Unix seconds"
+
+
+def parse_event(raw: Any, received_at: Optional[datetime] = None) -> HydrationEvent:
+    """
+    Validate one event as posted by a dispenser:
+      {"user_id": 3, "volume_ml": 180, "timestamp": "2025-01-01T08:30:00", "device_id": "main-1"}
+    `name` (the recognized face identity) may be sent instead of `user_id`; `timestamp`
+    may be ISO 8601 or Unix seconds and defaults to the time the server received it.
+    Raises ValueError with a client-facing message.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("event must be an object")
+
+    user_id, name = raw.get("user_id"), raw.get("name")
+    if user_id is not None:
+        if isinstance(user_id, bool) or not isinstance(user_id, int):
+            raise ValueError("'user_id' must be an integer")
+        name = None
+    elif not isinstance(name, str) or not name.strip():
+        raise ValueError("missing 'user_id' (or 'name')")
+    else:
+        name = name.strip()
+
+    volume = raw.get("volume_ml")
+    if isinstance(volume, bool) or not isinstance(volume, (int, float)) or \
+            (isinstance(volume, float) and not math.isfinite(volume)) or not 0 < volume <= MAX_VOLUME_ML:
+        raise ValueError(f"'volume_ml' must be a number in (0, {MAX_VOLUME_ML:g}]")
+
+    ts = raw.get("timestamp")
+    if ts is None:
+        timestamp = received_at or datetime.now()
+    elif isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        # JSON allows NaN/Infinity and numbers beyond datetime's range (year 1-9999)
+        if isinstance(ts, float) and not math.isfinite(ts):
+            raise ValueError(_TIMESTAMP_ERROR)
+        try:
+            timestamp = datetime.fromtimestamp(ts)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError(_TIMESTAMP_ERROR) from None
+    elif isinstance(ts, str):
+        try:
+            timestamp = datetime.fromisoformat(ts)
+            if timestamp.tzinfo is not None:
+                # stored as local naive time, like users.created_at
+                timestamp = timestamp.astimezone().replace(tzinfo=None)
+        except (OverflowError, ValueError):
+            raise ValueError(_TIMESTAMP_ERROR) from None
+    else:
+        raise ValueError(_TIMESTAMP_ERROR)
+
+    device_id = raw.get("device_id")
+    if device_id is not None and not isinstance(device_id, str):
+        raise ValueError("'device_id' must be a string")
+
+    return user_id, name, float(volume), timestamp, device_id
+
+
+class EventWriter:
+    """
+    Write-behind queue for hydration events.
+
+    Request threads submit() parsed events and return immediately; one writer
+    thread drains the queue and inserts everything that arrived within
+    `flush_interval` seconds (up to `batch_size` rows) with executemany in a single
+    transaction, so many dispensers reporting at once cost one commit per batch
+    instead of one per row. The same transaction folds the batch into the
+    per-user, per-day daily_intake rollup that the dashboard reads. When
+    `max_queue` events are pending, submit() raises Overloaded and the endpoint
+    answers 503 + Retry-After.
+
+    Events are durable only once flushed; close() (registered at exit) drains the queue.
+    `on_flush(user_ids)` is called from the writer thread after each committed batch.
+
+    Usage:
+      writer = EventWriter(db, batch_size=500, flush_interval=0.5)
+      writer.submit([parse_event(e) for e in payload["events"]])
+    """
+
+    def __init__(self, db, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_queue: int = 10000, retry_after: float = 1.0,
+                 on_flush: Optional[Callable[[List[int]], None]] = None):
+        self.db = db
+        self.on_flush = on_flush
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retry_after = retry_after
+        self._queue: "queue.Queue[Optional[HydrationEvent]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+        self.accepted = 0
+        self.written = 0
+        self.unknown_user = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush: Optional[datetime] = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, events: Iterable[HydrationEvent]) -> int:
+        """Queue events for the next flush. All-or-nothing: raises Overloaded if they don't fit."""
+        events = list(events)
+        if self._closed:
+            raise Overloaded("event writer is shutting down", self.retry_after)
+        self._ensure_started()
+        with self._submit_lock:
+            # reject the whole request rather than keeping a prefix, so a retry doesn't duplicate rows
+            if self._queue.qsize() + len(events) > self._queue.maxsize:
+                raise Overloaded("event queue full", self.retry_after)
+            for ev in events:
+                self._queue.put_nowait(ev)
+            self.accepted += len(events)
+        return len(events)
+
+    def _collect(self) -> Tuple[List[HydrationEvent], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                ev = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if ev is None:
+                return batch, True
+            batch.append(ev)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[HydrationEvent]) -> None:
+        try:
+            with self._write_lock, stage("events_flush"), self.db.transaction() as conn:
+                written, user_ids = self._write_batch(conn, batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %d hydration events", len(batch))
+            return
+        self.batches += 1
+        self.written += written
+        self.unknown_user += len(batch) - written
+        self.last_flush = datetime.now()
+        if self.on_flush is not None and user_ids:
+            try:
+                self.on_flush(user_ids)
+            except Exception:
+                logger.exception("Hydration event flush listener failed")
+
+    def _write_batch(self, conn, batch: List[HydrationEvent]) -> Tuple[int, List[int]]:
+        """
+        Insert one batch and fold it into daily_intake, inside the caller's
+        transaction. Returns (events written, ids of the users they belong to).
+        """
+        names = sorted({name for uid, name, _, _, _ in batch if uid is None})
+        ids_by_name = {}
+        if names:
+            # a name may have been re-enrolled; the newest user wins, as in recognition
+            rows = conn.execute(
+                f"SELECT name, MAX(id) AS id FROM users WHERE name IN ({','.join('?' * len(names))}) GROUP BY name",
+                names,
+            ).fetchall()
+            ids_by_name = {row["name"]: row["id"] for row in rows}
+
+        events = []
+        for uid, name, vol, ts, dev in batch:
+            uid = uid if uid is not None else ids_by_name.get(name)
+            if uid is not None:
+                events.append((uid, vol, ts, dev))
+        if not events:
+            return 0, []
+
+        # skip ids that don't exist (e.g. the user was deleted) instead of failing the batch
+        cur = self.db.executemany(
+            "INSERT INTO hydration_events (user_id, volume_ml, timestamp, device_id) "
+            "SELECT id, ?, ?, ? FROM users WHERE id = ?",
+            [(vol, ts, dev, uid) for uid, vol, ts, dev in events],
+        )
+        written = max(cur.rowcount, 0)
+
+        # one UPSERT per (user, day) touched by this batch
+        rollup = {}
+        for uid, vol, ts, _ in events:
+            key = (uid, ts.date())
+            total, count, last_ts, last_vol = rollup.get(key, (0.0, 0, None, None))
+            if last_ts is None or ts >= last_ts:
+                last_ts, last_vol = ts, vol
+            rollup[key] = (total + vol, count + 1, last_ts, last_vol)
+        self.db.executemany(
+            "INSERT INTO daily_intake (user_id, day, total_ml, event_count, last_event, last_volume_ml) "
+            "SELECT id, ?, ?, ?, ?, ? FROM users WHERE id = ? "
+            "ON CONFLICT (user_id, day) DO UPDATE SET "
+            "total_ml = total_ml + excluded.total_ml, "
+            "event_count = event_count + excluded.event_count, "
+            "last_volume_ml = CASE WHEN last_event IS NULL OR excluded.last_event >= last_event "
+            "THEN excluded.last_volume_ml ELSE last_volume_ml END, "
+            "last_event = MAX(COALESCE(last_event, excluded.last_event), excluded.last_event)",
+            [(day, total, count, last_ts, last_vol, uid)
+             for (uid, day), (total, count, last_ts, last_vol) in rollup.items()],
+        )
+        return written, sorted({uid for uid, _ in rollup})
+
+    def flush(self) -> None:
+        """Synchronously write whatever is queued right now (tests, shutdown)."""
+        batch = []
+        while True:
+            try:
+                ev = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if ev is None:
+                # keep the stop marker for the writer thread
+                self._queue.put(None)
+                break
+            batch.append(ev)
+        for i in range(0, len(batch), self.batch_size):
+            self._flush(batch[i:i + self.batch_size])
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop accepting events and drain the queue."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "accepted": self.accepted,
+            "written": self.written,
+            "unknown_user": self.unknown_user,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush": self.last_flush.isoformat(timespec="seconds") if self.last_flush else None,
+        }
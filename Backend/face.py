@@ -1,149 +1,435 @@
 import os
-import base64
+import time
 import logging
-from io import BytesIO
-from typing import Optional, List
+import threading
+from typing import Callable, Dict, Iterable, Optional, List, Tuple
 
 import numpy as np
-from PIL import Image, ImageOps
-import face_recognition
 
-logging.basicConfig(
-    filename='backend.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from encoding_cache import EncodingCache
+from gallery import ENCODING_DIM, FaceGallery
+from ann_index import IVFIndex
+from detection import DetectionConfig, detect_faces, load_models
+from imaging import DecodedImage, ImageDecodeError, decode_base64_image
+from metrics import FACES, stage
+
+logger = logging.getLogger(__name__)
 
 class FaceMatcher:
     """
     Minimal matcher that:
       - detects faces in a base64 image
       - loads face encodings from files in `faces_dir` (clears any old encodings)
+      - adds/removes single identities in memory without touching the rest of the gallery
       - searches a base64 image against the loaded encodings and returns the matching UUID (filename without ext)
 
     Expectations:
       - External process will place images in `faces_dir` named like "<UUID>.jpg" or "<UUID>.png".
       - If an image contains multiple faces, all encodings will be associated with that UUID.
+      - Encodings are cached in `cache_path` (default "<faces_dir>.cache.npz") so a reload
+        only re-encodes new or changed images. Pass cache_path="" to disable the cache.
+      - index="ivf" enables the approximate IVF index (see ann_index.py) for large
+        galleries; `ann_nprobe` trades recall for speed. The default "exact" scans all rows.
+      - enrollment, folder loading and search all detect faces with the same
+        DetectionConfig (see detection.py).
+      - with a `store` (embeddings.EmbeddingStore) the gallery is bulk-loaded from
+        SQLite instead of the folder; photos of users without stored encodings are
+        encoded once and saved to the store (see load_gallery()).
+      - load=False skips the initial load (gallery and models); call warm_up() to
+        load both in a background thread and check `ready` before serving recognition.
     """
 
-    def __init__(self, faces_dir: str = "faces"):
+    def __init__(self, faces_dir: str = "faces", cache_path: Optional[str] = None,
+                 index: str = "exact", ann_nprobe: int = 8, ann_nlist: Optional[int] = None,
+                 detection: Optional[DetectionConfig] = None, store=None, load: bool = True):
         self.faces_dir = faces_dir
+        self.store = store
+        self.detection = detection or DetectionConfig()
         os.makedirs(self.faces_dir, exist_ok=True)
-        # parallel lists: encodings[i] corresponds to uuids[i]
-        self.encodings: List[np.ndarray] = []
-        self.uuids: List[str] = []
-        self.load_faces_from_folder()
+        if cache_path is None:
+            cache_path = os.path.normpath(self.faces_dir) + ".cache.npz"
+        self.cache: Optional[EncodingCache] = (
+            EncodingCache(cache_path, fingerprint=self.detection.fingerprint()) if cache_path else None
+        )
+        if self.cache is not None:
+            self.cache.load()
+        # contiguous (N,128) float32 matrix + parallel uuid array
+        self.gallery = FaceGallery()
+        if index == "ivf":
+            self.gallery.attach_index(IVFIndex(nlist=ann_nlist, nprobe=ann_nprobe))
+        elif index != "exact":
+            raise ValueError(f"Unknown index mode: {index!r} (expected 'exact' or 'ivf')")
+        self._lock = threading.RLock()
+        # one reload at a time; while it builds the new gallery (outside _lock), single
+        # identity changes are recorded here as (uuid, encodings or None for removed)
+        # and replayed onto it, so they are not lost when it is swapped in
+        self._reload_lock = threading.Lock()
+        self._reload_changes: Optional[List[Tuple[str, Optional[List[np.ndarray]]]]] = None
+        # set once a gallery load has completed; recognition against a half-built gallery would miss
+        self._gallery_loaded = threading.Event()
+        # set once the face_recognition models are loaded (and warm_up's `then` has run);
+        # until then a recognition request would block on the import for seconds
+        self._models_ready = threading.Event()
+        self.load_error: Optional[str] = None
+        if load:
+            self.load_gallery()
+            self.load_models()
+
+    @property
+    def ready(self) -> bool:
+        """True once both the gallery and the face_recognition models are loaded."""
+        return self._gallery_loaded.is_set() and self._models_ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._gallery_loaded.wait(timeout):
+            return False
+        return self._models_ready.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def load_models(self) -> None:
+        """Load the face_recognition models now (see detection.load_models) and count them as ready."""
+        load_models()
+        self._models_ready.set()
+
+    def warm_up(self, then: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """
+        Load the gallery and the face_recognition models in a daemon thread, then run
+        `then` (e.g. starting worker processes). `ready` turns True only after all
+        three succeeded; on failure it stays False and `load_error` says why.
+        """
+        def run():
+            try:
+                self.load_gallery()
+                load_models()
+                if then is not None:
+                    then()
+                self._models_ready.set()
+            except Exception as e:
+                self.load_error = f"{type(e).__name__}: {e}"
+                logger.exception("Gallery warm-up failed")
+
+        thread = threading.Thread(target=run, name="gallery-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """(N,128) float32 view of the loaded encodings; row i belongs to uuids[i]."""
+        return self.gallery.matrix
+
+    @property
+    def uuids(self) -> List[str]:
+        return list(self.gallery.uuids)
+
+    def snapshot(self) -> Tuple[int, np.ndarray, List[str]]:
+        """Return (gallery version, copy of the encoding matrix, uuids) taken atomically."""
+        with self._lock:
+            return self.gallery.version, self.gallery.matrix.copy(), list(self.gallery.uuids)
+
+    def add_identity(self, uuid: str, encodings: List[np.ndarray]) -> int:
+        """
+        Add (or replace) the encodings for `uuid` in memory. Cost depends only on the
+        number of encodings for this identity, not on the gallery size.
+        Returns the number of encodings stored.
+        """
+        with self._lock:
+            added = self.gallery.add(uuid, encodings)
+            self._record_change(uuid, encodings)
+        logger.info("Added identity %s with %d encodings", uuid, added)
+        return added
+
+    def apply_changes(self, removed: Iterable[str], added: Dict[str, List[np.ndarray]]) -> None:
+        """Apply a gallery delta (see gallery_sync.py): drop `removed`, add or replace `added`."""
+        with self._lock:
+            for uuid in removed:
+                self.gallery.remove(uuid)
+                self._record_change(uuid, None)
+            for uuid, encodings in added.items():
+                self.gallery.add(uuid, encodings)
+                self._record_change(uuid, encodings)
+
+    def replace_gallery(self, matrix: np.ndarray, uuids: List[str]) -> None:
+        """Replace the whole gallery with a snapshot's rows."""
+        with self._lock:
+            self._bulk_load(lambda: self.gallery.load(matrix, uuids))
+        self._gallery_loaded.set()
 
-    def detect_faces_b64(self, image_b64: str, debug_path: str = "/tmp/debug_face.jpg") -> bool:
+    def remove_identity(self, uuid: str, delete_files: bool = False) -> int:
+        """
+        Remove all in-memory encodings for `uuid`. With delete_files=True the
+        "<uuid>.<ext>" images in faces_dir are deleted too, so a later folder reload
+        does not bring the identity back. Returns the number of encodings removed.
+        """
+        with self._lock:
+            removed = self.gallery.remove(uuid)
+            self._record_change(uuid, None)
+        if delete_files:
+            for ext in (".jpg", ".jpeg", ".png"):
+                path = os.path.join(self.faces_dir, uuid + ext)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    logger.exception("Failed to delete face image %s", path)
+        logger.info("Removed identity %s (%d encodings)", uuid, removed)
+        return removed
+
+    def detect_faces_b64(self, image_b64: str) -> bool:
         """
         Return True if the base64 image contains at least one detectable face, else False.
-        Writes a debug image to debug_path so you can open it manually.
         """
-        logging.info("Processing image: %s", type(image_b64))
+        return len(self.encode_faces_b64(image_b64)) > 0
 
+    def encode_faces_b64(self, image_b64: str) -> List[np.ndarray]:
+        """
+        Return the face encodings found in the base64 image (empty list if none).
+        Does not modify the gallery; pass the result to add_identity() to enroll.
+        """
         try:
-            # strip data URL prefix if present
-            if image_b64.startswith("data:"):
-                image_b64 = image_b64.split(",", 1)[1]
-
-            img_bytes = base64.b64decode(image_b64)
-
-            from pathlib import Path
-            BASE = Path(__file__).resolve().parent
-            out = BASE / "Storage" / "image_debug.jpg"
-            out.parent.mkdir(parents=True, exist_ok=True)
-            out.write_bytes(img_bytes)
-
-            # Load image using PIL to preserve EXIF orientation, then convert to RGB numpy array
-            img = Image.open(BytesIO(img_bytes))
-            img = ImageOps.exif_transpose(img).convert("RGB")
-            img_np = np.array(img)  # dtype should be uint8 and shape (H,W,3)
-
-            # First check for face locations (faster feedback)
-            locations = face_recognition.face_locations(img_np, model="hog", number_of_times_to_upsample=1)
-            logging.info("face_locations found: %s", locations)
-
-            # If none, try upsampling (helps with small/low-res faces)
-            if len(locations) == 0:
-                locations = face_recognition.face_locations(img_np, model="hog", number_of_times_to_upsample=2)
-                logging.info("after upsample, face_locations found: %s", locations)
-
-            # Optionally try the CNN model if you have it and want more accuracy (slower, needs dlib-cnn)
-            # locations = face_recognition.face_locations(img_np, model="cnn")
-
-            # If we have locations, get encodings
-            encs = face_recognition.face_encodings(img_np, known_face_locations=locations) if locations else []
-            logging.info("num encodings: %d", len(encs))
-            self.load_faces_from_folder()
-            return len(encs) > 0
+            return self.encode_faces(decode_base64_image(image_b64))
+        except ImageDecodeError:
+            logger.exception("Error in encode_faces_b64")
+            return []
 
+    def encode_faces(self, image: DecodedImage) -> List[np.ndarray]:
+        """
+        Return the face encodings found in an already decoded image (empty list if none).
+        Detection uses the shared pipeline in detection.py (downscaled HOG, bounded retry).
+        """
+        try:
+            with stage("image_decode"):
+                rgb = image.rgb
+            encs = self._encode_rgb(rgb)
         except Exception:
-            logging.exception("Error in detect_faces_b64")
-            return False
+            logger.exception("Error in encode_faces")
+            return []
+        FACES.inc(result="found" if encs else "not_found")
+        return encs
+
+    def _encode_rgb(self, img_np: np.ndarray) -> List[np.ndarray]:
+        """Detect faces on a downscaled copy, then encode them at full resolution."""
+        with stage("detect"):
+            locations = detect_faces(img_np, self.detection)
+        logger.debug("face_locations found: %s", locations)
+
+        # Optionally try the CNN model if you have it and want more accuracy (slower, needs dlib-cnn):
+        # DetectionConfig(model="cnn")
+
+        # If we have locations, get encodings
+        encs = []
+        if locations:
+            import face_recognition
+            with stage("encode"):
+                encs = face_recognition.face_encodings(img_np, known_face_locations=locations)
+        logger.debug("num encodings: %d", len(encs))
+        return encs
 
     def load_faces_from_folder(self) -> None:
         """
         Clear existing encodings and load all face encodings from files in self.faces_dir.
         File names are expected to be "<UUID>.<ext>". For each face found in a file,
         an encoding is added and associated with that file's UUID (filename without extension).
+
+        Images whose size/mtime (or content hash) match the encoding cache are not
+        decoded again; cache entries for deleted files are dropped.
+
+        This is a maintenance operation (startup, /refresh-folder); enrollment and
+        deletion use add_identity()/remove_identity() instead.
         """
-        self.encodings.clear()
-        self.uuids.clear()
+        self._reload(self._load_gallery_from_folder)
 
-        if not os.path.isdir(self.faces_dir):
+    def load_gallery(self) -> None:
+        """
+        Clear existing encodings and reload them: from the embedding store when there
+        is one (one query, no image decoding), else from the faces folder.
+
+        Users without stored encodings (enrolled before the store existed) are
+        imported from their photo, users.image_path or "<faces_dir>/<name>.<ext>",
+        and saved to the store so this happens only once.
+        """
+        if self.store is None:
+            self.load_faces_from_folder()
             return
+        self._reload(self._load_gallery_from_store)
+
+    def _reload(self, build: Callable[[], Tuple[List[str], np.ndarray]]) -> None:
+        """
+        Build a new gallery with `build` -> (uuids, matrix) and swap it in. Building
+        (queries, image decoding, encoding) runs without _lock, so recognition keeps
+        matching against the current gallery meanwhile; only the swap holds it.
+        """
+        with self._reload_lock:
+            with self._lock:
+                self._reload_changes = []
+            try:
+                uuids, matrix = build()
+                with self._lock:
+                    self._bulk_load(lambda: self.gallery.load(matrix, uuids))
+                    for uuid, encodings in self._reload_changes:
+                        if encodings is None:
+                            self.gallery.remove(uuid)
+                        else:
+                            self.gallery.add(uuid, encodings)
+            finally:
+                with self._lock:
+                    self._reload_changes = None
+        self._gallery_loaded.set()
+
+    def _record_change(self, uuid: str, encodings: Optional[List[np.ndarray]]) -> None:
+        # called under _lock
+        if self._reload_changes is not None:
+            self._reload_changes.append((uuid, encodings))
+
+    def _bulk_load(self, load) -> None:
+        # build the ANN index once at the end instead of retraining as the gallery grows
+        index = self.gallery.detach_index()
+        try:
+            load()
+        finally:
+            if index is not None:
+                self.gallery.attach_index(index)
+
+    def _load_gallery_from_store(self) -> Tuple[List[str], np.ndarray]:
+        names, matrix = self.store.load()
+        stored = len(names)
+
+        imported, rows = 0, [matrix]
+        for user in self.store.missing():
+            path = self._find_image(user["name"], user["image_path"])
+            if path is None:
+                continue
+            try:
+                encs, _ = self._encode_file(path)
+            except Exception:
+                logger.exception("Failed to import face image %s", path)
+                continue
+            if len(encs) == 0:
+                continue
+            self.store.save(user["id"], encs, image_path=os.path.abspath(path))
+            # missing() has no name that load() returned (both take the newest user per name)
+            names.extend([user["name"]] * len(encs))
+            rows.append(self.store.as_stored(encs))
+            imported += 1
+
+        if imported and self.cache is not None:
+            self.cache.save()
+        logger.info("Loaded %d stored encodings for %d identities (%d imported from photos)",
+                    stored, len(set(names)), imported)
+        return names, np.concatenate(rows) if imported else matrix
 
+    def _find_image(self, name: str, image_path) -> Optional[str]:
+        if isinstance(image_path, str) and os.path.isfile(image_path):
+            return image_path
+        for ext in (".jpg", ".jpeg", ".png"):
+            path = os.path.join(self.faces_dir, name + ext)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _encode_file(self, path: str, st: Optional[os.stat_result] = None) -> Tuple[List[np.ndarray], bool]:
+        """
+        Return (encodings, re-encoded) for an image file; unchanged files are served
+        from the encoding cache without being decoded.
+        """
+        fname = os.path.basename(path)
+        st = st or os.stat(path)
+        encs, digest = self.cache.lookup(fname, path, st) if self.cache is not None else (None, None)
+        if encs is not None:
+            return encs, False
+        import face_recognition
+        img = face_recognition.load_image_file(path)
+        encs = self._encode_rgb(img)
+        if self.cache is not None:
+            # remember "no face" results too, so they are not retried on every reload
+            self.cache.put(fname, st, digest, encs, path=path)
+        return encs, True
+
+    def _load_gallery_from_folder(self) -> Tuple[List[str], np.ndarray]:
+        uuids: List[str] = []
+        rows: List[np.ndarray] = []
+        if not os.path.isdir(self.faces_dir):
+            return uuids, np.zeros((0, ENCODING_DIM), dtype=np.float32)
+
+        seen = []
+        encoded = 0
         for fname in os.listdir(self.faces_dir):
             if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
                 continue
             uuid = os.path.splitext(fname)[0]
             path = os.path.join(self.faces_dir, fname)
             try:
-                img = face_recognition.load_image_file(path)
-                encs = face_recognition.face_encodings(img)
-                if not encs:
+                st = os.stat(path)
+                seen.append(fname)
+                encs, reencoded = self._encode_file(path, st)
+                encoded += reencoded
+                if len(encs) == 0:
                     # No face found in this file — skip it
                     continue
                 # Associate each encoding (in case of multiple faces) with the same uuid
-                for enc in encs:
-                    self.encodings.append(enc)
-                    self.uuids.append(uuid)
+                uuids.extend([uuid] * len(encs))
+                rows.extend(encs)
             except Exception:
                 # silently skip unreadable/invalid files
                 continue
 
+        if self.cache is not None:
+            self.cache.prune(seen)
+            self.cache.save()
+        logger.info("Loaded %d encodings from %d files (%d re-encoded)", len(uuids), len(seen), encoded)
+        return uuids, np.asarray(rows, dtype=np.float32).reshape(-1, ENCODING_DIM)
+
     def search_image_b64(self, image_b64: str, tolerance: float = 0.6) -> Optional[str]:
         """
         Search the provided base64 image against the loaded encodings.
-        Returns the matched UUID (filename without extension) of the first match, or None if not found.
+        Returns the UUID (filename without extension) of the closest match within
+        `tolerance`, or None if not found.
         If the query image contains no detectable face, returns None.
         """
+        matches = self.find_matches_b64(image_b64, tolerance=tolerance, top_k=1)
+        return matches[0][0] if matches else None
+
+    def find_matches_b64(self, image_b64: str, tolerance: float = 0.6, top_k: int = 1) -> List[Tuple[str, float]]:
+        """
+        Return up to `top_k` distinct (uuid, distance) pairs within `tolerance` for the
+        first face in the base64 image, nearest first. Empty if no face or no match.
+        """
+        try:
+            image = decode_base64_image(image_b64)
+        except ImageDecodeError:
+            return []
+        return self.find_matches(image, tolerance=tolerance, top_k=top_k)
+
+    def find_matches(self, image: DecodedImage, tolerance: float = 0.6, top_k: int = 1) -> List[Tuple[str, float]]:
+        """Same as find_matches_b64 for an already decoded image."""
+        query_enc = self.encode_query(image)
+        if query_enc is None:
+            return []
+        return self.match_encoding(query_enc, tolerance=tolerance, top_k=top_k)
+
+    def encode_query(self, image: DecodedImage) -> Optional[np.ndarray]:
+        """Return the encoding of the first face in `image`, or None if there is none."""
         try:
-            img_bytes = base64.b64decode(image_b64)
-            from pathlib import Path
-            BASE = Path(__file__).resolve().parent
-            out = BASE / "Storage" / "image_debug.jpg"
-            out.parent.mkdir(parents=True, exist_ok=True)
-            out.write_bytes(img_bytes)
-            logging.info("Image saved to %s", out)
-            
-            img = Image.open(BytesIO(img_bytes)).convert("RGB")
-            img_np = np.array(img)
-            query_encs = face_recognition.face_encodings(img_np)
-            if not query_encs:
-                return None
-            query_enc = query_encs[0]  # use the first face found in the query image
+            with stage("image_decode"):
+                rgb = image.rgb
+            query_encs = self._encode_rgb(rgb)
         except Exception:
             return None
-        
-        if not self.encodings:
+        FACES.inc(result="found" if query_encs else "not_found")
+        if not query_encs:
             return None
-        matches = face_recognition.compare_faces(self.encodings, query_enc, tolerance=tolerance)
-        if True in matches:
-            idx = matches.index(True)
-            return self.uuids[idx]
-        return None
+        return query_encs[0]  # use the first face found in the query image
+
+    def match_encoding(self, query_enc: np.ndarray, tolerance: float = 0.6, top_k: int = 1) -> List[Tuple[str, float]]:
+        """Match one encoding against the gallery in a single vectorized pass."""
+        with self._lock, stage("match"):
+            return self.gallery.search(query_enc, tolerance=tolerance, top_k=top_k)
+
+    def match_encodings(self, queries: np.ndarray, tolerance: float = 0.6, top_k: int = 1) -> List[List[Tuple[str, float]]]:
+        """Match a (B,128) batch of encodings with one matrix product against the gallery."""
+        with self._lock, stage("match_batch"):
+            return self.gallery.search_batch(queries, tolerance=tolerance, top_k=top_k)
 
     def loaded_count(self) -> int:
         """Return number of encodings currently loaded in memory."""
-        return len(self.encodings)
+        return len(self.gallery)
@@ -0,0 +1,122 @@
+# frame_gate.py
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from imaging import DecodedImage, ImageDecodeError
+
+Matches = List[Tuple[str, float]]
+
+
+class _DeviceState:
+    __slots__ = ("reference", "matches", "top_k", "version", "recognized_at")
+
+    def __init__(self, reference: np.ndarray, matches: Matches, top_k: int, version: int, recognized_at: float):
+        self.reference = reference
+        self.matches = matches
+        self.top_k = top_k
+        self.version = version
+        self.recognized_at = recognized_at
+
+
+class FrameGate:
+    """
+    Per-device change detection in front of recognition.
+
+    For each device it keeps a `width` x `height` grayscale reference of the last
+    frame that was actually recognized, plus that result. A new frame is compared
+    to the reference by mean absolute difference (after removing each frame's mean
+    brightness, so auto-exposure drift doesn't count as change); below `threshold`
+    (0-255 scale) the scene is considered unchanged and the previous result
+    ("no face" or the last identity) is returned without running detection.
+
+    The reference is only replaced on a real recognition, so slow drift still
+    accumulates into a change. A result is reused for at most `max_age` seconds
+    and never across gallery changes.
+
+    Usage:
+      gate = FrameGate(threshold=4.0, max_age=5.0)
+      matches = gate.check(device, image, top_k, version)
+      if matches is None:
+          matches = recognize(image)
+          gate.record(device, image, top_k, version, matches)
+    """
+
+    def __init__(self, width: int = 32, height: int = 24, threshold: float = 4.0,
+                 max_age: float = 5.0, max_devices: int = 256):
+        self.width = width
+        self.height = height
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_devices = max(1, max_devices)
+        self._lock = threading.Lock()
+        self._devices: "OrderedDict[str, _DeviceState]" = OrderedDict()
+
+        self.checks = 0
+        self.skipped = 0
+        self.changed = 0
+        self.expired = 0
+        self.no_reference = 0
+
+    def _thumbnail(self, image: DecodedImage) -> np.ndarray:
+        thumb = image.gray_thumbnail(self.width, self.height).astype(np.float32)
+        thumb -= thumb.mean()
+        return thumb
+
+    def difference(self, a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.abs(a - b).mean())
+
+    def check(self, device: str, image: DecodedImage, top_k: int, version: int) -> Optional[Matches]:
+        """Return the previous result if the scene is unchanged, else None (recognize the frame)."""
+        try:
+            thumb = self._thumbnail(image)
+        except ImageDecodeError:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self.checks += 1
+            state = self._devices.get(device)
+            if state is None or state.version != version or state.top_k < top_k:
+                self.no_reference += 1
+                return None
+            if now - state.recognized_at > self.max_age:
+                self.expired += 1
+                return None
+            if self.difference(thumb, state.reference) >= self.threshold:
+                self.changed += 1
+                return None
+            self.skipped += 1
+            self._devices.move_to_end(device)
+            return state.matches[:top_k]
+
+    def record(self, device: str, image: DecodedImage, top_k: int, version: int, matches: Matches) -> None:
+        """Make this recognized frame the device's new reference."""
+        try:
+            thumb = self._thumbnail(image)
+        except ImageDecodeError:
+            return
+        with self._lock:
+            self._devices[device] = _DeviceState(thumb, list(matches), top_k, version, time.monotonic())
+            self._devices.move_to_end(device)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+    def forget(self, device: str) -> None:
+        with self._lock:
+            self._devices.pop(device, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "checks": self.checks,
+                "skipped": self.skipped,
+                "skip_rate": (self.skipped / self.checks) if self.checks else 0.0,
+                "changed": self.changed,
+                "expired": self.expired,
+                "no_reference": self.no_reference,
+                "threshold": self.threshold,
+            }
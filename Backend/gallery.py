@@ -0,0 +1,241 @@
+# gallery.py
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ENCODING_DIM = 128
+
+
+class FaceGallery:
+    """
+    In-memory face gallery stored as one contiguous float32 matrix.
+
+    Row i of `matrix` is an encoding belonging to `uuids[i]`. The backing array is
+    preallocated and doubles in size when full, so adding an identity is amortized
+    O(encodings added). Removing an identity swap-removes its rows (the last row
+    fills each hole), so nothing is shifted.
+
+    An optional approximate index (see ann_index.IVFIndex) can be attached; it is
+    notified of every row change and narrows search to a subset of rows.
+
+    Not thread-safe on its own; FaceMatcher serializes access with its lock.
+
+    Usage:
+      gallery = FaceGallery()
+      gallery.add("alice", [enc1, enc2])
+      gallery.search(query_enc, tolerance=0.6, top_k=3)  # [("alice", 0.31), ...]
+      gallery.remove("alice")
+    """
+
+    def __init__(self, dim: int = ENCODING_DIM, capacity: int = 64):
+        self.dim = dim
+        self._matrix = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._uuids = np.empty(max(capacity, 1), dtype=object)
+        self._size = 0
+        # uuid -> row indices
+        self._rows: Dict[str, List[int]] = {}
+        # bumped on every change so caches/indexes can detect a stale gallery
+        self.version = 0
+        self.index = None
+        # squared row norms for batched search, valid for _sq_norms_version
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._sq_norms_version = -1
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(N, dim) float32 view of the active rows (no copy)."""
+        return self._matrix[:self._size]
+
+    @property
+    def uuids(self) -> np.ndarray:
+        """(N,) object array of uuids parallel to `matrix` (no copy)."""
+        return self._uuids[:self._size]
+
+    def identities(self) -> List[str]:
+        return list(self._rows.keys())
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._rows
+
+    def attach_index(self, index) -> None:
+        """Attach an approximate index; it is built from the current rows immediately."""
+        self.index = index
+        index.on_attach(self)
+
+    def detach_index(self):
+        """Detach and return the current index (e.g. to avoid incremental upkeep during a bulk load)."""
+        index, self.index = self.index, None
+        return index
+
+    def clear(self) -> None:
+        self._uuids[:self._size] = None
+        self._size = 0
+        self._rows.clear()
+        if self.index is not None:
+            self.index.on_clear()
+        self.version += 1
+
+    def add(self, uuid: str, encodings: Iterable[np.ndarray]) -> int:
+        """Add (or replace) the encodings for `uuid`. Returns the number of rows stored."""
+        encs = np.asarray(list(encodings), dtype=np.float32).reshape(-1, self.dim)
+        self._remove_rows(uuid)
+        k = len(encs)
+        if k:
+            self._reserve(self._size + k)
+            start = self._size
+            self._matrix[start:start + k] = encs
+            self._uuids[start:start + k] = uuid
+            self._rows[uuid] = list(range(start, start + k))
+            self._size += k
+            if self.index is not None:
+                self.index.on_add(start, start + k)
+        self.version += 1
+        return k
+
+    def load(self, matrix: np.ndarray, uuids: Sequence[str]) -> int:
+        """
+        Replace the whole gallery with `matrix` (row i belongs to uuids[i]) in one
+        copy instead of one add() per identity. Returns the number of rows stored.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        if len(matrix) != len(uuids):
+            raise ValueError(f"{len(matrix)} rows but {len(uuids)} uuids")
+        self.clear()
+        n = len(matrix)
+        if n:
+            self._reserve(n)
+            self._matrix[:n] = matrix
+            self._uuids[:n] = uuids
+            for i, uuid in enumerate(uuids):
+                self._rows.setdefault(uuid, []).append(i)
+            self._size = n
+            if self.index is not None:
+                self.index.on_add(0, n)
+        self.version += 1
+        return n
+
+    def remove(self, uuid: str) -> int:
+        """Remove all rows for `uuid`. Returns the number of rows removed."""
+        removed = self._remove_rows(uuid)
+        if removed:
+            self.version += 1
+        return removed
+
+    def _reserve(self, needed: int) -> None:
+        cap = len(self._matrix)
+        if needed <= cap:
+            return
+        while cap < needed:
+            cap *= 2
+        matrix = np.zeros((cap, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        uuids = np.empty(cap, dtype=object)
+        uuids[:self._size] = self._uuids[:self._size]
+        self._matrix, self._uuids = matrix, uuids
+
+    def _remove_rows(self, uuid: str) -> int:
+        rows = self._rows.pop(uuid, None)
+        if not rows:
+            return 0
+        for idx in sorted(rows, reverse=True):
+            last = self._size - 1
+            if self.index is not None:
+                self.index.on_remove(idx)
+            if idx != last:
+                moved_uuid = self._uuids[last]
+                self._matrix[idx] = self._matrix[last]
+                self._uuids[idx] = moved_uuid
+                moved_rows = self._rows[moved_uuid]
+                moved_rows[moved_rows.index(last)] = idx
+                if self.index is not None:
+                    self.index.on_move(last, idx)
+            self._uuids[last] = None
+            self._size -= 1
+        return len(rows)
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        """Euclidean distance from `query` to every row, computed in one vectorized pass."""
+        diff = self.matrix - np.asarray(query, dtype=np.float32)
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+    def search(self, query: np.ndarray, tolerance: float = 0.6, top_k: int = 1,
+               exact: bool = False, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to `top_k` distinct identities within `tolerance` of `query`,
+        nearest first, as (uuid, distance) pairs. Ties resolve to the lower row index.
+
+        With an attached (trained) index only its candidate rows are scanned, unless
+        exact=True. `nprobe` overrides the index's probe count for this call.
+        """
+        if self._size == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        rows = None
+        if self.index is not None and not exact:
+            rows = self.index.candidates(query, nprobe)
+        if rows is None:
+            return self._rank(self.distances(query), tolerance, top_k)
+        if len(rows) == 0:
+            return []
+        diff = self._matrix[rows] - query
+        return self._rank(np.sqrt(np.einsum("ij,ij->i", diff, diff)), tolerance, top_k, rows)
+
+    def search_batch(self, queries: np.ndarray, tolerance: float = 0.6, top_k=1) -> List[List[Tuple[str, float]]]:
+        """
+        Exact search for a (B, dim) batch of queries. All B x N distances come from one
+        matrix product, |q|^2 - 2 q.m + |m|^2; row norms are cached per gallery version.
+        `top_k` may be an int or a per-query sequence.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        ks = [top_k] * len(queries) if isinstance(top_k, int) else list(top_k)
+        if self._size == 0:
+            return [[] for _ in queries]
+        if self._sq_norms_version != self.version:
+            self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+            self._sq_norms_version = self.version
+        q_sq = np.einsum("ij,ij->i", queries, queries)
+        d2 = q_sq[:, None] - 2.0 * (queries @ self.matrix.T) + self._sq_norms[None, :]
+        dists = np.sqrt(np.maximum(d2, 0.0))
+        return [self._rank(dists[i], tolerance, ks[i]) for i in range(len(queries))]
+
+    def best_match(self, query: np.ndarray, tolerance: float = 0.6) -> Optional[Tuple[str, float]]:
+        hits = self.search(query, tolerance, top_k=1)
+        return hits[0] if hits else None
+
+    def _rank(self, dists: np.ndarray, tolerance: float, top_k: int,
+              rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        return rank_matches(dists, self._uuids, tolerance, top_k, rows)
+
+
+def rank_matches(dists: np.ndarray, uuids, tolerance: float, top_k: int,
+                 rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+    """
+    Turn distances into the nearest distinct identities under `tolerance`.
+    `uuids[row]` names each gallery row; `rows` maps dists[i] to its gallery row
+    when only a subset was scanned.
+    """
+    if len(dists) == 0:
+        return []
+    if top_k == 1:
+        i = int(np.argmin(dists))
+        if dists[i] > tolerance:
+            return []
+        row = int(rows[i]) if rows is not None else i
+        return [(uuids[row], float(dists[i]))]
+
+    candidates = np.flatnonzero(dists <= tolerance)
+    candidates = candidates[np.argsort(dists[candidates], kind="stable")]
+    results: List[Tuple[str, float]] = []
+    seen = set()
+    for i in candidates:
+        uuid = uuids[int(rows[i]) if rows is not None else i]
+        if uuid in seen:
+            continue
+        seen.add(uuid)
+        results.append((uuid, float(dists[i])))
+        if len(results) >= top_k:
+            break
+    return results
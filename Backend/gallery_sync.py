@@ -0,0 +1,257 @@
+# gallery_sync.py
+import os
+import re
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from gallery import ENCODING_DIM
+
+logger = logging.getLogger(__name__)
+
+_FILE_RE = re.compile(r"^(delta|snapshot)-(\d{12})\.npz$")
+
+# uuid -> (k, 128) encodings
+Added = Dict[str, np.ndarray]
+
+
+def diff_galleries(before: Tuple[np.ndarray, List[str]], after: Tuple[np.ndarray, List[str]]) -> Tuple[Added, List[str], List[str]]:
+    """
+    Compare two (matrix, uuids) gallery states.
+    Returns (added or changed identities with their new encodings, new uuids, removed uuids).
+    """
+    def group(matrix, uuids):
+        rows: Dict[str, List[int]] = {}
+        for i, uuid in enumerate(uuids):
+            rows.setdefault(uuid, []).append(i)
+        return {uuid: matrix[idx] for uuid, idx in rows.items()}
+
+    old, new = group(*before), group(*after)
+    added = {uuid: encs for uuid, encs in new.items()
+             if uuid not in old or old[uuid].shape != encs.shape or not np.array_equal(old[uuid], encs)}
+    created = sorted(uuid for uuid in new if uuid not in old)
+    removed = sorted(uuid for uuid in old if uuid not in new)
+    return added, created, removed
+
+
+class GallerySync:
+    """
+    Keeps the galleries of several backend processes on one host consistent through
+    a versioned journal in `directory`:
+
+      delta-<version>.npz     identities removed, identities added/replaced with their encodings
+      snapshot-<version>.npz  the whole gallery as of <version>, every `snapshot_every` versions
+      LATEST                  newest version number (a hint, for detecting pruned deltas)
+
+    A process that changes its gallery (enrollment, deletion, /refresh-folder) publishes
+    the change as the next version. A delta is written to a temp file and hard-linked
+    into place, so a version number is claimed atomically and only complete files
+    become visible. Every process polls for delta-<its version + 1> (one stat per
+    `interval`) and applies deltas in version order, its own included; replaying a
+    delta is idempotent. A process that falls behind deltas already pruned (more
+    than `keep` versions) loads the newest snapshot first.
+
+    The journal starts from whatever the process loaded at startup (the embedding
+    store); the version it then had is taken in the constructor, before loading.
+
+    Usage:
+      sync = GallerySync("faces.journal", face_manager)
+      face_manager.load_gallery()
+      sync.start()
+      version = sync.publish(added={"alice": encs}, removed=["bob"])
+    """
+
+    def __init__(self, directory: str, matcher, interval: float = 1.0,
+                 snapshot_every: int = 100, keep: int = 200):
+        self.directory = directory
+        self.matcher = matcher
+        self.interval = interval
+        self.snapshot_every = max(1, snapshot_every)
+        self.keep = max(self.snapshot_every, keep)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._latest_mtime = None
+        self.version = self._scan()[0]
+
+        self.published = 0
+        self.applied = 0
+        self.snapshots_loaded = 0
+        self.errors = 0
+
+    # --- files ----------------------------------------------------------------
+
+    def _path(self, kind: str, version: int) -> str:
+        return os.path.join(self.directory, f"{kind}-{version:012d}.npz")
+
+    def _scan(self) -> Tuple[int, Optional[int]]:
+        """(newest version in the journal, newest snapshot version or None) from a directory listing."""
+        newest, snapshot = 0, None
+        for name in os.listdir(self.directory):
+            m = _FILE_RE.match(name)
+            if not m:
+                continue
+            version = int(m.group(2))
+            newest = max(newest, version)
+            if m.group(1) == "snapshot" and (snapshot is None or version > snapshot):
+                snapshot = version
+        return newest, snapshot
+
+    def _write(self, kind: str, version: int, removed: Iterable[str], added: Added) -> bool:
+        """Write one journal file; False if `version` was already taken by another process."""
+        uuids, rows = [], []
+        for uuid, encs in added.items():
+            encs = np.asarray(encs, dtype=np.float32).reshape(-1, ENCODING_DIM)
+            uuids.extend([uuid] * len(encs))
+            rows.append(encs)
+        matrix = np.concatenate(rows) if rows else np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        tmp = os.path.join(self.directory, f".{kind}-{os.getpid()}-{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, removed=np.array(list(removed), dtype=str), uuids=np.array(uuids, dtype=str),
+                     encodings=matrix)
+        try:
+            os.link(tmp, self._path(kind, version))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+
+    def _read(self, kind: str, version: int) -> Tuple[List[str], List[str], np.ndarray]:
+        with np.load(self._path(kind, version), allow_pickle=False) as data:
+            return [str(u) for u in data["removed"]], [str(u) for u in data["uuids"]], data["encodings"]
+
+    def _write_latest(self, version: int) -> None:
+        path = os.path.join(self.directory, "LATEST")
+        try:
+            with open(path, encoding="utf8") as f:
+                if int(f.read().strip() or 0) >= version:
+                    return
+        except (OSError, ValueError):
+            pass
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(str(version))
+        os.replace(tmp, path)
+
+    def _latest_changed(self) -> Optional[int]:
+        """LATEST's version if the file changed since the last call, else None."""
+        path = os.path.join(self.directory, "LATEST")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._latest_mtime:
+                return None
+            with open(path, encoding="utf8") as f:
+                latest = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+        self._latest_mtime = mtime
+        return latest
+
+    # --- publishing -----------------------------------------------------------
+
+    def publish(self, added: Optional[Added] = None, removed: Iterable[str] = ()) -> int:
+        """
+        Append one change to the journal and bring this process up to date with it.
+        The caller has usually applied the change to its own gallery already.
+        Returns the version of the change.
+        """
+        added, removed = dict(added or {}), list(removed)
+        with self._lock:
+            version = max(self.version, self._scan()[0]) + 1
+            while not self._write("delta", version, removed, added):
+                version += 1
+            self._write_latest(version)
+            self.published += 1
+            self.poll()
+            if version % self.snapshot_every == 0:
+                self._snapshot()
+        return version
+
+    def _snapshot(self) -> None:
+        """Write the current gallery as snapshot-<version> and prune old journal files."""
+        version, matrix, uuids = self.matcher.snapshot()
+        added: Added = {}
+        for uuid, encs in zip(uuids, matrix):
+            added.setdefault(uuid, []).append(encs)
+        self._write("snapshot", self.version, (), added)
+        for name in os.listdir(self.directory):
+            m = _FILE_RE.match(name)
+            if not m:
+                continue
+            v = int(m.group(2))
+            if (m.group(1) == "delta" and v <= self.version - self.keep) or \
+                    (m.group(1) == "snapshot" and v < self.version):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    # --- watching -------------------------------------------------------------
+
+    def poll(self) -> int:
+        """Apply any deltas published since the last poll. Returns how many were applied."""
+        with self._lock:
+            applied = self._apply_deltas()
+            if applied:
+                return applied
+            latest = self._latest_changed()
+            if latest is None or latest <= self.version:
+                return 0
+            # the next delta is gone: it was pruned while this process lagged behind
+            snapshot = self._scan()[1]
+            if snapshot is None or snapshot <= self.version:
+                return 0
+            removed, uuids, matrix = self._read("snapshot", snapshot)
+            self.matcher.replace_gallery(matrix, uuids)
+            self.version = snapshot
+            self.snapshots_loaded += 1
+            logger.info("Gallery caught up from snapshot %d", snapshot)
+            return 1 + self._apply_deltas()
+
+    def _apply_deltas(self) -> int:
+        applied = 0
+        while True:
+            try:
+                removed, uuids, matrix = self._read("delta", self.version + 1)
+            except FileNotFoundError:
+                return applied
+            added: Dict[str, list] = {}
+            for uuid, encs in zip(uuids, matrix):
+                added.setdefault(uuid, []).append(encs)
+            self.matcher.apply_changes(removed, added)
+            self.version += 1
+            self.applied += 1
+            applied += 1
+
+    def start(self) -> None:
+        """Poll every `interval` seconds in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="gallery-sync", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                self.errors += 1
+                logger.exception("Gallery sync poll failed")
+                time.sleep(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "published": self.published,
+            "applied": self.applied,
+            "snapshots_loaded": self.snapshots_loaded,
+            "errors": self.errors,
+        }
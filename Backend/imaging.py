@@ -0,0 +1,139 @@
+# imaging.py
+import re
+import base64
+import binascii
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# regex to parse data URLs: data:[<mime>][;params][;base64],<data>
+DATA_URL_RE = re.compile(r'^data:([^,]*),', flags=re.I)
+
+# longest side requested from the decoder for DecodedImage.preview
+PREVIEW_SIDE = 32
+
+MIME_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+class ImageDecodeError(ValueError):
+    """Raised when an uploaded image payload cannot be decoded."""
+
+
+def detect_extension_from_bytes(data: bytes) -> Optional[str]:
+    """Return extension like 'png', 'jpg', or None if unknown (magic-byte sniffing)."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def split_data_url(payload: str) -> Tuple[Optional[str], str]:
+    """
+    Return (mime_type or None, base64 part) for a data URL or a bare base64 string.
+    Any data URL prefix is accepted; a mime type that is not image/* (or none, as in
+    "data:;base64,") is dropped and the image type is sniffed from the bytes instead.
+    """
+    m = DATA_URL_RE.match(payload)
+    if m:
+        mime_type = m.group(1).split(";", 1)[0].strip().lower()
+        return (mime_type if mime_type.startswith("image/") else None), payload[m.end():]
+    return None, payload
+
+
+class DecodedImage:
+    """
+    One uploaded image, decoded once and shared by every consumer of a request.
+
+      - `data`: the raw encoded bytes (what gets written to disk)
+      - `ext`: file extension from the data-URL mime type or the magic bytes
+      - `rgb`: (H, W, 3) uint8 array, EXIF-orientation corrected; decoded lazily on
+        first access and then reused, so detection, encoding and matching never
+        decode the same frame twice
+      - `preview`: small grayscale copy for frame hashing / change detection; JPEGs
+        are decoded at 1/2..1/8 scale (draft mode), so this never decodes the full frame
+    """
+
+    __slots__ = ("data", "mime_type", "ext", "_rgb", "_preview")
+
+    def __init__(self, data: bytes, mime_type: Optional[str] = None):
+        self.data = data
+        self.mime_type = mime_type
+        self.ext = MIME_EXTENSIONS.get(mime_type) if mime_type else None
+        if not self.ext:
+            self.ext = detect_extension_from_bytes(data)
+        self._rgb: Optional[np.ndarray] = None
+        self._preview: Optional[Image.Image] = None
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            try:
+                img = Image.open(BytesIO(self.data))
+                img = ImageOps.exif_transpose(img)
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+                # writable, C-contiguous uint8 array as dlib expects
+                self._rgb = np.array(img)
+            except Exception as e:
+                raise ImageDecodeError(f"Could not decode image: {e}") from e
+        return self._rgb
+
+    @property
+    def preview(self) -> Image.Image:
+        if self._preview is None:
+            try:
+                img = Image.open(BytesIO(self.data))
+                img.draft("L", (PREVIEW_SIDE, PREVIEW_SIDE))
+                img = img.convert("L")
+                img.thumbnail((PREVIEW_SIDE * 2, PREVIEW_SIDE * 2), Image.BILINEAR)
+                self._preview = img
+            except Exception as e:
+                raise ImageDecodeError(f"Could not decode image: {e}") from e
+        return self._preview
+
+    def gray_thumbnail(self, width: int, height: int) -> np.ndarray:
+        """(height, width) uint8 grayscale thumbnail resized from `preview`."""
+        return np.asarray(self.preview.resize((width, height), Image.BILINEAR))
+
+
+def decode_base64_image(payload: str) -> DecodedImage:
+    """
+    Parse a data URL or bare base64 string and base64-decode it exactly once.
+    Whitespace (e.g. line-wrapped base64) is only stripped when the strict decode fails.
+    Raises ImageDecodeError on invalid input.
+    """
+    if not payload or not isinstance(payload, str):
+        raise ImageDecodeError("No image data provided")
+    mime_type, b64 = split_data_url(payload.strip())
+    try:
+        data = base64.b64decode(b64, validate=True)
+    except (binascii.Error, ValueError):
+        try:
+            data = base64.b64decode(re.sub(r'\s+', '', b64), validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ImageDecodeError(f"Invalid base64 data: {e}") from e
+    if not data:
+        raise ImageDecodeError("Empty image data")
+    return DecodedImage(data, mime_type)
+
+
+def decode_image_bytes(data: bytes, mime_type: Optional[str] = None) -> DecodedImage:
+    """Wrap raw encoded image bytes (e.g. an image/jpeg request body) without any copying."""
+    if not data:
+        raise ImageDecodeError("No image data provided")
+    if mime_type:
+        mime_type = mime_type.split(";", 1)[0].strip().lower()
+    return DecodedImage(data, mime_type)
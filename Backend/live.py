@@ -0,0 +1,143 @@
+# live.py
+import json
+import time
+import threading
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+# (id, event type, serialized JSON data)
+Message = Tuple[int, str, str]
+
+
+class Broadcaster:
+    """
+    One in-process fan-out publisher for dashboard updates.
+
+    publish() serializes a small delta once and appends it to a bounded ring;
+    every connected dashboard reads the same ring from its own cursor, so the
+    cost of an update does not grow with the number of viewers and nothing
+    touches SQLite per client. A viewer that falls more than `history` messages
+    behind (or reconnects too late) gets a "reset" and reloads the page.
+
+    With a threaded WSGI server each open stream holds a worker thread, so at most
+    `max_streams` are served at once; further dashboards poll with
+    ?since=<id> instead, which returns immediately. Streams are closed after
+    `stream_lifetime` seconds and EventSource reconnects with Last-Event-ID.
+
+    Usage:
+      live = Broadcaster()
+      live.publish("intake", {"user_id": 3, "intake_ml": 750})
+
+      # SSE view:
+      return Response(live.stream(last_id), mimetype="text/event-stream")
+    """
+
+    def __init__(self, history: int = 1024, max_streams: int = 8, heartbeat: float = 15.0,
+                 stream_lifetime: float = 300.0):
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.stream_lifetime = stream_lifetime
+        self._cond = threading.Condition()
+        self._ring: "deque[Message]" = deque(maxlen=history)
+        self._last_id = 0
+        self.streams = 0
+        self.published = 0
+        self.rejected = 0
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event: str, data: dict) -> int:
+        payload = json.dumps(data, separators=(",", ":"), default=str)
+        with self._cond:
+            self._last_id += 1
+            self._ring.append((self._last_id, event, payload))
+            self.published += 1
+            self._cond.notify_all()
+            return self._last_id
+
+    def _since(self, cursor: int) -> Optional[List[Message]]:
+        """Messages after `cursor`, or None if some of them already left the ring."""
+        if cursor > self._last_id:
+            # cursor from before a restart
+            return None
+        if cursor == self._last_id:
+            return []
+        oldest = self._ring[0][0] if self._ring else self._last_id + 1
+        if cursor < oldest - 1:
+            return None
+        return [m for m in self._ring if m[0] > cursor]
+
+    def poll(self, cursor: int, timeout: float = 0.0) -> Tuple[int, Optional[List[Message]]]:
+        """
+        Return (new cursor, messages after `cursor`), waiting up to `timeout` seconds
+        for at least one. Messages is None when the caller must reset.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while cursor == self._last_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return cursor, []
+                self._cond.wait(remaining)
+            messages = self._since(cursor)
+            return self._last_id, messages
+
+    def try_open(self) -> bool:
+        """Reserve a streaming slot; False when max_streams are already open."""
+        with self._cond:
+            if self.streams >= self.max_streams:
+                self.rejected += 1
+                return False
+            self.streams += 1
+            return True
+
+    def stream(self, cursor: Optional[int] = None) -> "_Stream":
+        """SSE body for one dashboard; call only after try_open() succeeded."""
+        return _Stream(self, self._generate(self._last_id if cursor is None else cursor))
+
+    def _generate(self, cursor: int) -> Iterator[str]:
+        # tell EventSource how long to wait before reconnecting
+        yield f"retry: 3000\nid: {cursor}\n\n"
+        closes_at = time.monotonic() + self.stream_lifetime
+        while time.monotonic() < closes_at:
+            cursor, messages = self.poll(cursor, timeout=self.heartbeat)
+            if messages is None:
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+            elif not messages:
+                yield ": keep-alive\n\n"
+            else:
+                yield "".join(f"id: {mid}\nevent: {event}\ndata: {data}\n\n" for mid, event, data in messages)
+
+    def _release(self) -> None:
+        with self._cond:
+            self.streams -= 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "last_id": self._last_id,
+                "published": self.published,
+                "streams": self.streams,
+                "max_streams": self.max_streams,
+                "rejected_streams": self.rejected,
+            }
+
+
+class _Stream:
+    """WSGI response iterable that frees its streaming slot when the server closes it."""
+
+    def __init__(self, broadcaster: Broadcaster, body: Iterator[str]):
+        self._broadcaster = broadcaster
+        self._body = body
+        self._closed = False
+
+    def __iter__(self) -> Iterator[str]:
+        return self._body
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._body.close()
+            self._broadcaster._release()
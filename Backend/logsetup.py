@@ -0,0 +1,229 @@
+# logsetup.py
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+# attributes every LogRecord has; anything else was passed via extra= and goes into the JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line:
+      {"ts": "2025-01-01T08:30:00.123", "level": "INFO", "logger": "face", "msg": "...", "thread": "..."}
+    plus any extra= fields, "suppressed" (see RateLimitFilter) and "exc" for tracebacks.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per (logger, level, message template): each repeats at most
+    `rate` times per second after a burst of `burst`. The next record that gets
+    through carries suppressed=<n dropped since the last one>, so a storm of the
+    same error shows up as one line with a count instead of flooding the file.
+    """
+
+    def __init__(self, rate: float = 20.0, burst: int = 50, max_keys: int = 1024):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [tokens, last refill, suppressed since last emitted]
+        self._buckets: Dict[tuple, list] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    # formatted-in-place messages (f-strings) each get their own key
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                self.dropped += 1
+                return False
+            bucket[0] -= 1.0
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the low-level records of chatty loggers:
+    rates={"detection": 0.1} keeps ~10% of records at or below `max_level` from
+    "detection" and its children. Records above `max_level` always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float], max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rates = dict(rates)
+        self.max_level = max_level
+        self._resolved: Dict[str, float] = {}
+        self.dropped = 0
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, probe = 1.0, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that does as little as possible on the calling thread: the record
+    is queued as-is (message formatting, JSON and file I/O happen on the listener
+    thread) and dropped, not waited for, when the queue is full.
+    """
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # in-process queue: no pickling, so skip the default eager getMessage()/format()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Root logging setup: request threads only run level checks and the rate limit /
+    sampling filters, then queue the record; one QueueListener thread formats it
+    and writes it to a size-rotated file (and optionally stderr).
+
+    Usage:
+      pipeline = configure_logging("backend.log", levels={"werkzeug": "WARNING"})
+      pipeline.stats()
+    """
+
+    def __init__(self, filename: str, level="INFO", levels: Optional[Dict[str, str]] = None,
+                 json_format: bool = True, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 queue_size: int = 10000, rate_limit: Optional[float] = 20.0, rate_burst: int = 50,
+                 sample: Optional[Dict[str, float]] = None, console: bool = False):
+        self.queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+        self.handler = _NonBlockingQueueHandler(self.queue)
+        self.rate_limit = RateLimitFilter(rate_limit, rate_burst) if rate_limit else None
+        self.sampling = SamplingFilter(sample) if sample else None
+        if self.sampling is not None:
+            self.handler.addFilter(self.sampling)
+        if self.rate_limit is not None:
+            self.handler.addFilter(self.rate_limit)
+
+        formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+        file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding="utf-8", delay=True)
+        file_handler.setFormatter(formatter)
+        handlers = [file_handler]
+        if console:
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+            handlers.append(stream)
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+
+        self.level = level
+        self.levels = dict(levels or {})
+
+    def install(self) -> "LogPipeline":
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        # per-module levels are checked before a LogRecord is even created
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.listener.start()
+        return self
+
+    def stop(self) -> None:
+        """Write out everything queued and stop the listener thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+        logging.getLogger().removeHandler(self.handler)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped_queue_full": self.handler.dropped,
+            "rate_limited": self.rate_limit.dropped if self.rate_limit is not None else 0,
+            "sampled_out": self.sampling.dropped if self.sampling is not None else 0,
+        }
+
+
+_pipeline: Optional[LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def configure_logging(filename: str = "backend.log", **options) -> LogPipeline:
+    """Install the queued logging pipeline on the root logger, replacing any previous one."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+        else:
+            atexit.register(_stop)
+        _pipeline = LogPipeline(filename, **options).install()
+        return _pipeline
+
+
+def _stop() -> None:
+    if _pipeline is not None:
+        _pipeline.stop()
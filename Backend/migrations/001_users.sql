@@ -0,0 +1,8 @@
+-- Users enrolled from the dashboard; faces/<name>.<ext> holds their enrollment photo.
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    image_path TEXT,
+    daily_limit_ml REAL,
+    created_at TIMESTAMP
+);
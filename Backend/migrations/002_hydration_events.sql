@@ -0,0 +1,11 @@
+-- One row per sip / dispense reported by an ESP32-Main unit.
+CREATE TABLE IF NOT EXISTS hydration_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    volume_ml REAL NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    device_id TEXT
+);
+
+-- per-user history and "today" lookups
+CREATE INDEX IF NOT EXISTS idx_hydration_events_user_ts ON hydration_events (user_id, timestamp);
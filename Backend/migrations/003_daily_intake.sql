@@ -0,0 +1,21 @@
+-- Per-user, per-day totals maintained by the event writer in the same transaction
+-- as the events themselves, so the dashboard never aggregates hydration_events.
+CREATE TABLE IF NOT EXISTS daily_intake (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    total_ml REAL NOT NULL DEFAULT 0,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    last_event TIMESTAMP,
+    last_volume_ml REAL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+-- the dashboard joins users to this table on the primary key (user_id, day)
+
+-- backfill from events recorded before this migration
+INSERT OR REPLACE INTO daily_intake (user_id, day, total_ml, event_count, last_event, last_volume_ml)
+SELECT e.user_id, date(e.timestamp), SUM(e.volume_ml), COUNT(*), MAX(e.timestamp),
+       (SELECT l.volume_ml FROM hydration_events l
+        WHERE l.user_id = e.user_id AND date(l.timestamp) = date(e.timestamp)
+        ORDER BY l.timestamp DESC LIMIT 1)
+FROM hydration_events e
+GROUP BY e.user_id, date(e.timestamp);
@@ -0,0 +1,16 @@
+-- Face encodings of enrolled users, one row per face, quantized (see embeddings.py):
+-- vector is the 128-d encoding as int8 (value = q * scale) or float16 (scale 1.0).
+CREATE TABLE IF NOT EXISTS face_embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    dtype TEXT NOT NULL,
+    scale REAL NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_face_embeddings_user ON face_embeddings (user_id);
+
+-- image_path used to receive the "face found" boolean instead of the photo's path;
+-- those rows get their real path when their embeddings are first imported
+UPDATE users SET image_path = NULL WHERE image_path IN ('0', '1', 0, 1);
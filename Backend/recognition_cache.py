@@ -0,0 +1,158 @@
+# recognition_cache.py
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from imaging import DecodedImage
+
+Matches = List[Tuple[str, float]]
+
+
+def dhash(image: DecodedImage, hash_size: int = 8) -> int:
+    """
+    64-bit difference hash of the frame: sign of horizontal gradients on a
+    (hash_size x hash_size+1) grayscale thumbnail. Small changes in noise,
+    exposure or JPEG artefacts flip few bits; a person entering the frame flips many.
+    """
+    thumb = image.gray_thumbnail(hash_size + 1, hash_size).astype(np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class RecognitionCache:
+    """
+    Short-TTL cache of recognition results in front of the matcher, keyed by
+    device and a perceptual hash (dHash) of the frame.
+
+    A frame whose hash is within `max_distance` bits of a cached frame from the
+    same device, cached less than `ttl` seconds ago, gets the cached result
+    (including "no face"). Byte-identical frames skip even the thumbnail decode.
+    Entries are evicted LRU beyond `max_entries`, and everything is dropped when
+    the gallery version changes (enrollment, deletion, reload).
+
+    Usage:
+      cache = RecognitionCache(ttl=2.0, max_entries=256)
+      hit, matches = cache.get(device, image, top_k, face_manager.gallery.version)
+      if not hit:
+          matches = recognize(image)
+          cache.put(device, image, top_k, version, matches)
+    """
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 256, max_distance: int = 4,
+                 digest_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_distance = max_distance
+        self.digest_entries = digest_entries
+        self._lock = threading.Lock()
+        # (device, hash) -> (expires_at, top_k, matches)
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, int, Matches]]" = OrderedDict()
+        self._by_device: Dict[str, Set[int]] = {}
+        # sha1 of the encoded bytes -> dHash, so identical re-sent frames are not decoded
+        self._digests: "OrderedDict[bytes, int]" = OrderedDict()
+        self._version: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def frame_key(self, image: DecodedImage) -> int:
+        digest = hashlib.sha1(image.data).digest()
+        with self._lock:
+            h = self._digests.get(digest)
+            if h is not None:
+                self._digests.move_to_end(digest)
+                return h
+        h = dhash(image)
+        with self._lock:
+            self._digests[digest] = h
+            if len(self._digests) > self.digest_entries:
+                self._digests.popitem(last=False)
+        return h
+
+    def _check_version(self, version: int) -> None:
+        # versions only move forward; a put() carrying an older version is stale
+        if self._version is None or version > self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_device.clear()
+            self._version = version
+
+    def _drop(self, key: Tuple[str, int]) -> None:
+        self._entries.pop(key, None)
+        hashes = self._by_device.get(key[0])
+        if hashes is not None:
+            hashes.discard(key[1])
+            if not hashes:
+                del self._by_device[key[0]]
+
+    def _find(self, device: str, h: int) -> Optional[Tuple[str, int]]:
+        if (device, h) in self._entries:
+            return device, h
+        if self.max_distance <= 0:
+            return None
+        best, best_dist = None, self.max_distance + 1
+        for other in self._by_device.get(device, ()):
+            dist = bin(h ^ other).count("1")
+            if dist < best_dist:
+                best, best_dist = other, dist
+        return (device, best) if best is not None else None
+
+    def get(self, device: str, image: DecodedImage, top_k: int, version: int) -> Tuple[bool, Optional[Matches]]:
+        """Return (True, matches) for a fresh cached result, else (False, None)."""
+        h = self.frame_key(image)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            key = self._find(device, h)
+            if key is not None:
+                expires_at, cached_top_k, matches = self._entries[key]
+                if expires_at <= now:
+                    self._drop(key)
+                    self.expirations += 1
+                elif cached_top_k >= top_k:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, matches[:top_k]
+            self.misses += 1
+            return False, None
+
+    def put(self, device: str, image: DecodedImage, top_k: int, version: int, matches: Matches) -> None:
+        h = self.frame_key(image)
+        with self._lock:
+            self._check_version(version)
+            if version != self._version:
+                return
+            key = (device, h)
+            self._entries[key] = (time.monotonic() + self.ttl, top_k, list(matches))
+            self._entries.move_to_end(key)
+            self._by_device.setdefault(device, set()).add(h)
+            while len(self._entries) > self.max_entries:
+                old = next(iter(self._entries))
+                self._drop(old)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Production entry point for the SmartHydrate backend.
+
+Runs the Flask app on a multi-threaded WSGI server instead of the debug dev server:
+  - waitress, if installed (pip install waitress)
+  - otherwise werkzeug's server, handling connections on a pool of --threads threads
+
+Recognition requests beyond the admission limits configured in server.py are
+answered with 503 + Retry-After; current queue depth is on GET /stats.
+The server answers as soon as it is listening: the face gallery warms up in the
+background, GET /healthz is liveness and GET /readyz turns 200 once recognition
+can be served (recognition endpoints answer 503 until then).
+
+Usage (from Backend/):
+  python serve.py --host 0.0.0.0 --port 5000 --threads 16
+"""
+
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    # seconds a connection may sit idle (e.g. keep-alive between requests) before its
+    # pool thread is freed
+    timeout = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    werkzeug's WSGI server with each connection handled on a fixed pool of `threads`
+    threads (werkzeug's own threaded server starts one thread per connection, with
+    no limit). Connections beyond the pool wait for a free thread.
+
+    Usage:
+      PooledWSGIServer("0.0.0.0", 5000, app, threads=16).serve_forever()
+    """
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int):
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        # as socketserver.ThreadingMixIn.process_request_thread
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the SmartHydrate backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="WSGI worker threads (default: recognition slots + queue + live streams + 4)")
+    parser.add_argument("--server", choices=("auto", "waitress", "werkzeug"), default="auto")
+    args = parser.parse_args()
+
+    # imported here, not at module level: recognition worker processes are spawned
+    # and re-import this file, and must not build the app themselves
+    from server import app, admission, live
+
+    # enough threads that queued requests can be admitted or fast-failed by the
+    # admission controller, one per live dashboard stream, and a few left over
+    # for the dashboard and /stats
+    threads = args.threads or (admission.max_concurrent + admission.max_queue + live.max_streams + 4)
+
+    server = args.server
+    if server == "auto":
+        try:
+            import waitress  # noqa: F401
+            server = "waitress"
+        except ImportError:
+            server = "werkzeug"
+
+    logging.info("Serving on %s:%d with %s (%d threads)", args.host, args.port, server, threads)
+    if server == "waitress":
+        from waitress import serve
+        serve(app, host=args.host, port=args.port, threads=threads)
+    else:
+        PooledWSGIServer(args.host, args.port, app, threads).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,58 +8,418 @@ The "image" value can be:
 """
 
 import os
-import re
+import atexit
 import uuid
-import base64
-import imghdr
-import logging
 import json
+import time
+import multiprocessing
+from functools import wraps
 from sqliteDB import SqliteDB
 from user import delete_user
-from flask import g, current_app, Flask, request, jsonify, render_template
+from flask import g, current_app, Flask, Response, request, jsonify, render_template
 from werkzeug.utils import secure_filename
-from binascii import Error as BinAsciiError
 
 from face import FaceMatcher
-
-# Configure logging to file
-logging.basicConfig(
-    filename='backend.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from detection import DetectionConfig
+from workers import RecognitionExecutor
+from batching import MatchBatcher
+from admission import AdmissionController, Overloaded
+from debug_capture import DebugCapture
+from events import EventWriter, parse_event
+from embeddings import EmbeddingStore
+from gallery_sync import GallerySync, diff_galleries
+from recognition_cache import RecognitionCache
+from frame_gate import FrameGate
+from live import Broadcaster
+from imaging import ImageDecodeError, decode_base64_image, decode_image_bytes
+import metrics
+from metrics import FRAME_GATE, MATCHES, RECOGNITION_CACHE, REQUEST_SECONDS, stage
+from logsetup import configure_logging
 
 app = Flask(__name__, template_folder="views")
 
+# Recognition worker processes (see workers.py) are spawned and re-import the script
+# that started the server; under `python server.py` that is this module. They only
+# need workers._recognize, so everything here that opens log files, migrates the
+# database or starts threads and timers runs in the main process only.
+MAIN_PROCESS = multiprocessing.parent_process() is None
+
+# Logging: request threads only queue records; a background listener formats them
+# as JSON lines into LOG_FILE, rotated at LOG_MAX_BYTES. LOG_LEVELS sets per-module
+# levels, LOG_RATE_LIMIT caps repeats of one message per second (after a burst of
+# LOG_RATE_BURST) and LOG_SAMPLE keeps only a fraction of the DEBUG records of
+# chatty modules (see logsetup.py). Sampling only touches DEBUG records, so it is off
+# at the default INFO level; with LOG_LEVEL = 'DEBUG' enable it, e.g.
+# {'detection': 0.05, 'face': 0.05}, to keep per-frame detection logs affordable.
+app.config['LOG_FILE'] = 'backend.log'
+app.config['LOG_LEVEL'] = 'INFO'
+app.config['LOG_LEVELS'] = {'werkzeug': 'WARNING'}
+app.config['LOG_JSON'] = True
+app.config['LOG_MAX_BYTES'] = 10 * 1024 * 1024
+app.config['LOG_BACKUP_COUNT'] = 5
+app.config['LOG_QUEUE_SIZE'] = 10000
+app.config['LOG_RATE_LIMIT'] = 20
+app.config['LOG_RATE_BURST'] = 50
+app.config['LOG_SAMPLE'] = {}
+
+log_pipeline = configure_logging(
+    app.config['LOG_FILE'],
+    level=app.config['LOG_LEVEL'],
+    levels=app.config['LOG_LEVELS'],
+    json_format=app.config['LOG_JSON'],
+    max_bytes=app.config['LOG_MAX_BYTES'],
+    backup_count=app.config['LOG_BACKUP_COUNT'],
+    queue_size=app.config['LOG_QUEUE_SIZE'],
+    rate_limit=app.config['LOG_RATE_LIMIT'],
+    rate_burst=app.config['LOG_RATE_BURST'],
+    sample=app.config['LOG_SAMPLE'],
+) if MAIN_PROCESS else None
+
 # Limit request size (e.g., 16 MB). Adjust as needed.
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-# Initialize the database
-db = SqliteDB("app.db")
+# Initialize the database. Connections are pooled and keep their pragmas and
+# statement cache; set SQLITE_LOG_SQL (with DEBUG logging) to trace statements.
+# SMARTHYDRATE_DATABASE in the environment overrides the file (relative paths are
+# under instance/); it is read here, before anything migrates or reads the database.
+app.config['DATABASE'] = os.environ.get('SMARTHYDRATE_DATABASE', 'app.db')
+app.config['SQLITE_POOL_SIZE'] = 8
+app.config['SQLITE_LOG_SQL'] = False
+db = SqliteDB(app.config['DATABASE'], pool_size=app.config['SQLITE_POOL_SIZE'], log_sql=app.config['SQLITE_LOG_SQL'])
 db.init_app(app)
 
-face_manager = FaceMatcher()
+# Schema lives in migrations/ (001_users.sql, 002_hydration_events.sql, ...)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+if MAIN_PROCESS:
+    with app.app_context():
+        applied = db.migrate(MIGRATIONS_DIR)
+        if applied:
+            app.logger.info("Applied migrations: %s", applied)
+
+# Hydration events are written behind the request: batched every EVENTS_FLUSH_INTERVAL
+# seconds (or EVENTS_BATCH_SIZE rows) in one transaction; beyond EVENTS_MAX_QUEUE
+# pending events POST /events answers 503 (see events.py).
+app.config['EVENTS_BATCH_SIZE'] = 500
+app.config['EVENTS_FLUSH_INTERVAL'] = 0.5
+app.config['EVENTS_MAX_QUEUE'] = 10000
+app.config['EVENTS_MAX_PER_REQUEST'] = 1000
+
+# Live dashboard updates: one shared publisher, SSE on GET /stream. At most
+# LIVE_MAX_STREAMS dashboards stream at once (each holds a server thread); the
+# rest poll GET /stream?since=<id> (see live.py).
+app.config['LIVE_MAX_STREAMS'] = 8
+app.config['LIVE_HISTORY'] = 1024
+app.config['LIVE_HEARTBEAT'] = 15.0
+
+live = Broadcaster(
+    history=app.config['LIVE_HISTORY'],
+    max_streams=app.config['LIVE_MAX_STREAMS'],
+    heartbeat=app.config['LIVE_HEARTBEAT'],
+)
 
-# regex to parse data URLs: data:<mime>;base64,<data>
-DATA_URL_RE = re.compile(r'^data:(image/[^;]+);base64,(.+)$', flags=re.I)
 
+def publish_intake(user_ids):
+    """Push today's totals for users touched by a flushed event batch (one query per batch)."""
+    for user in dashboard_users(user_ids):
+        live.publish("intake", {
+            "user_id": user['id'],
+            "intake_ml": user['intake_ml'],
+            "goal_ml": user['daily_limit_ml'] or 0,
+            "event_count": user['event_count'],
+            "last_event_time": user['last_event_time'],
+            "last_volume_ml": user['last_volume_ml'],
+        })
+
+
+event_writer = EventWriter(
+    db,
+    batch_size=app.config['EVENTS_BATCH_SIZE'],
+    flush_interval=app.config['EVENTS_FLUSH_INTERVAL'],
+    max_queue=app.config['EVENTS_MAX_QUEUE'],
+    on_flush=publish_intake,
+)
+if MAIN_PROCESS:
+    atexit.register(event_writer.close)
+
+# Gallery search: "exact" scans every encoding; "ivf" uses the approximate index
+# (see ann_index.py and benchmarks/ann_benchmark.py for picking nprobe).
+app.config['FACE_INDEX'] = 'exact'
+app.config['FACE_ANN_NPROBE'] = 8
+# Detection: HOG runs on a copy downscaled to this longest side; the upsample=2
+# retry for "no face" frames is skipped past the pixel/time budget (see detection.py).
+app.config['FACE_DETECT_MAX_SIDE'] = 640
+app.config['FACE_DETECT_FALLBACK_UPSAMPLE'] = 2
+app.config['FACE_DETECT_TIME_BUDGET'] = 0.25
+
+# Face encodings are stored per user in SQLite (face_embeddings) as EMBEDDING_DTYPE:
+# "int8" (128 bytes + scale per face) or "float16" (256 bytes), and the gallery is
+# bulk-loaded from there at startup (see embeddings.py; accuracy vs float64 in
+# benchmarks/quantization_benchmark.py).
+app.config['EMBEDDING_DTYPE'] = 'int8'
+
+embedding_store = EmbeddingStore(db, dtype=app.config['EMBEDDING_DTYPE'])
+
+face_manager = FaceMatcher(
+    store=embedding_store,
+    index=app.config['FACE_INDEX'],
+    ann_nprobe=app.config['FACE_ANN_NPROBE'],
+    detection=DetectionConfig(
+        max_side=app.config['FACE_DETECT_MAX_SIDE'],
+        fallback_upsample=app.config['FACE_DETECT_FALLBACK_UPSAMPLE'],
+        fallback_time_budget=app.config['FACE_DETECT_TIME_BUDGET'],
+    ),
+    load=False,
+)
 
-def detect_extension_from_bytes(data: bytes):
-    """Return extension like 'png', 'jpeg', or None if unknown."""
-    kind = imghdr.what(None, h=data)
-    if kind == 'jpeg':
-        return 'jpg'
-    return kind  # may be 'png', 'gif', etc. or None
+# Recognition execution: "inline" runs in the request thread; "process" runs
+# detection/encoding in a pool of worker processes that share the gallery through
+# shared memory (see workers.py). RECOGNITION_WORKERS=None uses one per CPU core.
+app.config['RECOGNITION_EXECUTOR'] = 'inline'
+app.config['RECOGNITION_WORKERS'] = None
+# A process-mode request not done after RECOGNITION_TIMEOUT seconds, or hitting a
+# crashed worker pool, gets 503 + Retry-After like a request refused by admission
+app.config['RECOGNITION_TIMEOUT'] = 30.0
+app.config['RECOGNITION_RETRY_AFTER'] = 2
+# Micro-batching of gallery matching for concurrent inline requests (see batching.py)
+app.config['RECOGNITION_BATCHING'] = False
+app.config['BATCH_WINDOW_MS'] = 3
+app.config['BATCH_MAX_SIZE'] = 16
+
+match_batcher = MatchBatcher(
+    face_manager,
+    window_ms=app.config['BATCH_WINDOW_MS'],
+    max_batch=app.config['BATCH_MAX_SIZE'],
+) if app.config['RECOGNITION_BATCHING'] else None
+
+recognition_executor = RecognitionExecutor(
+    face_manager,
+    mode=app.config['RECOGNITION_EXECUTOR'],
+    workers=app.config['RECOGNITION_WORKERS'],
+    batcher=match_batcher,
+    timeout=app.config['RECOGNITION_TIMEOUT'],
+    retry_after=app.config['RECOGNITION_RETRY_AFTER'],
+)
 
+# Several backend processes on one host keep their galleries consistent through a
+# versioned journal in GALLERY_SYNC_DIR: enrollments, deletions and /refresh-folder
+# are published as deltas, and every process polls for new versions every
+# GALLERY_SYNC_INTERVAL seconds (see gallery_sync.py).
+app.config['GALLERY_SYNC_ENABLED'] = True
+app.config['GALLERY_SYNC_DIR'] = os.path.join(os.getcwd(), "faces.journal")
+app.config['GALLERY_SYNC_INTERVAL'] = 1.0
+app.config['GALLERY_SYNC_SNAPSHOT_EVERY'] = 100
+
+# taken before the gallery loads, so changes published meanwhile are replayed after it
+gallery_sync = GallerySync(
+    app.config['GALLERY_SYNC_DIR'],
+    face_manager,
+    interval=app.config['GALLERY_SYNC_INTERVAL'],
+    snapshot_every=app.config['GALLERY_SYNC_SNAPSHOT_EVERY'],
+) if app.config['GALLERY_SYNC_ENABLED'] and MAIN_PROCESS else None
+
+
+def publish_gallery_change(added=None, removed=()):
+    """Share a change already applied to this process's gallery with the other processes."""
+    if gallery_sync is None:
+        return face_manager.gallery.version
+    try:
+        return gallery_sync.publish(added=added, removed=removed)
+    except Exception:
+        # this process already has the change; the others pick it up on their next /refresh-folder
+        app.logger.exception("Failed to publish gallery change")
+        return gallery_sync.version
+
+
+def start_recognition():
+    recognition_executor.start()
+    if gallery_sync is not None:
+        gallery_sync.start()
+
+
+# Startup: the gallery and the face_recognition models are loaded in a background
+# thread, so the dashboard, /events and /healthz answer right away; recognition and
+# enrollment answer 503 + Retry-After until GET /readyz reports ready.
+# SMARTHYDRATE_WARMUP=0 skips it for importers that load the gallery themselves
+# (face_manager.load_gallery() and load_models(), then start_recognition()), e.g. the benchmarks.
+app.config['GALLERY_WARMUP'] = os.environ.get('SMARTHYDRATE_WARMUP', '1') != '0'
+if app.config['GALLERY_WARMUP'] and MAIN_PROCESS:
+    face_manager.warm_up(then=start_recognition)
+
+# Admission control for the recognition endpoints: at most RECOGNITION_MAX_CONCURRENT
+# run at once, RECOGNITION_MAX_QUEUE more wait up to RECOGNITION_QUEUE_DEADLINE
+# seconds; the rest get 503 + Retry-After (see admission.py).
+app.config['RECOGNITION_MAX_CONCURRENT'] = recognition_executor.workers if app.config['RECOGNITION_EXECUTOR'] == 'process' else 2
+app.config['RECOGNITION_MAX_QUEUE'] = 16
+app.config['RECOGNITION_QUEUE_DEADLINE'] = 5.0
+
+admission = AdmissionController(
+    max_concurrent=app.config['RECOGNITION_MAX_CONCURRENT'],
+    max_queue=app.config['RECOGNITION_MAX_QUEUE'],
+    deadline=app.config['RECOGNITION_QUEUE_DEADLINE'],
+    retry_after=app.config['RECOGNITION_RETRY_AFTER'],
+)
+
+# Debug frame capture (off by default): frames are written off the request thread
+# into a ring of DEBUG_CAPTURE_RING files, optionally sampled / failures only.
+app.config['DEBUG_CAPTURE_ENABLED'] = False
+app.config['DEBUG_CAPTURE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Storage", "debug")
+app.config['DEBUG_CAPTURE_RING'] = 20
+app.config['DEBUG_CAPTURE_SAMPLE_RATE'] = 1.0
+app.config['DEBUG_CAPTURE_ONLY_ON_FAILURE'] = True
+
+debug_capture = DebugCapture(
+    app.config['DEBUG_CAPTURE_DIR'],
+    enabled=app.config['DEBUG_CAPTURE_ENABLED'],
+    ring_size=app.config['DEBUG_CAPTURE_RING'],
+    sample_rate=app.config['DEBUG_CAPTURE_SAMPLE_RATE'],
+    only_on_failure=app.config['DEBUG_CAPTURE_ONLY_ON_FAILURE'],
+)
+
+# Recognition result cache: a frame from the same device whose perceptual hash is
+# within RECOGNITION_CACHE_MAX_DISTANCE bits of one seen in the last
+# RECOGNITION_CACHE_TTL seconds reuses its result; dropped on any gallery change.
+app.config['RECOGNITION_CACHE_ENABLED'] = True
+app.config['RECOGNITION_CACHE_TTL'] = 2.0
+app.config['RECOGNITION_CACHE_SIZE'] = 256
+app.config['RECOGNITION_CACHE_MAX_DISTANCE'] = 4
+
+recognition_cache = RecognitionCache(
+    ttl=app.config['RECOGNITION_CACHE_TTL'],
+    max_entries=app.config['RECOGNITION_CACHE_SIZE'],
+    max_distance=app.config['RECOGNITION_CACHE_MAX_DISTANCE'],
+) if app.config['RECOGNITION_CACHE_ENABLED'] else None
+
+# Frame-change gating: per device, a frame whose FRAME_GATE_WIDTH x FRAME_GATE_HEIGHT
+# grayscale thumbnail differs from the last recognized one by less than
+# FRAME_GATE_THRESHOLD (mean absolute difference, 0-255) reuses that result for up
+# to FRAME_GATE_MAX_AGE seconds, skipping detection on idle cameras (see frame_gate.py).
+app.config['FRAME_GATE_ENABLED'] = True
+app.config['FRAME_GATE_WIDTH'] = 32
+app.config['FRAME_GATE_HEIGHT'] = 24
+app.config['FRAME_GATE_THRESHOLD'] = 4.0
+app.config['FRAME_GATE_MAX_AGE'] = 5.0
+
+frame_gate = FrameGate(
+    width=app.config['FRAME_GATE_WIDTH'],
+    height=app.config['FRAME_GATE_HEIGHT'],
+    threshold=app.config['FRAME_GATE_THRESHOLD'],
+    max_age=app.config['FRAME_GATE_MAX_AGE'],
+) if app.config['FRAME_GATE_ENABLED'] else None
+
+# Gauges read at scrape time, so they cost nothing per request
+metrics.GALLERY_ENCODINGS.set_function(face_manager.loaded_count)
+metrics.GALLERY_IDENTITIES.set_function(lambda: len(face_manager.gallery.identities()))
+metrics.REGISTRY.gauge(
+    "smarthydrate_recognition_in_flight", "Recognition requests currently holding an admission slot",
+).set_function(lambda: admission.in_flight)
+metrics.REGISTRY.gauge(
+    "smarthydrate_recognition_queue_depth", "Recognition requests waiting for an admission slot",
+).set_function(lambda: admission.waiting)
+
+
+@app.before_request
+def start_request_timer():
+    g._request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    started = getattr(g, "_request_started", None)
+    if started is not None:
+        # label by route rule, not raw path, to keep the series count bounded
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                method=request.method, status=response.status_code)
+    return response
+
+
+@app.route('/metrics')
+def metrics_route():
+    """Per-stage latency histograms, detection/match counters and gallery size in Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering; does not wait for the gallery."""
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once the gallery is loaded and recognition can be served, else 503."""
+    ready = face_manager.ready
+    body = {
+        "ready": ready,
+        "encodings": face_manager.loaded_count(),
+        "identities": len(face_manager.gallery.identities()),
+        "version": face_manager.gallery.version,
+    }
+    if face_manager.load_error:
+        body["error"] = face_manager.load_error
+    return jsonify(body), 200 if ready else 503
+
+
+def requires_gallery(view):
+    """Answer 503 + Retry-After while the gallery is warming up, before taking an admission slot."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not face_manager.ready:
+            resp = jsonify({"error": "Server starting", "details": "face gallery is still loading"})
+            resp.status_code = 503
+            resp.headers["Retry-After"] = str(app.config['RECOGNITION_RETRY_AFTER'])
+            return resp
+        return view(*args, **kwargs)
+    return wrapper
 
 
 @app.route('/refresh-folder')
 def refresh_folder():
-    face_manager.load_faces_from_folder()
-    # Convert numpy arrays to lists for serialization and printing
-    encodings_list = [enc.tolist() for enc in face_manager.encodings]
-    print(encodings_list)
-    return jsonify({"message": "Folder refreshed successfully", "encodings": encodings_list}), 200
+    """
+    Full reload from the embedding store; also imports photos of users that have no
+    stored encodings yet (e.g. after manual edits to the faces folder). Only what
+    changed is published to the other processes and reported back.
+    """
+    _, matrix, uuids = face_manager.snapshot()
+    face_manager.load_gallery()
+    _, new_matrix, new_uuids = face_manager.snapshot()
+    changed, added, removed = diff_galleries((matrix, uuids), (new_matrix, new_uuids))
+    version = publish_gallery_change(added=changed, removed=removed) if (changed or removed) else \
+        (gallery_sync.version if gallery_sync is not None else face_manager.gallery.version)
+    app.logger.info("Folder refreshed: %d encodings, %d added, %d updated, %d removed",
+                    len(new_uuids), len(added), len(changed) - len(added), len(removed))
+    return jsonify({
+        "message": "Folder refreshed successfully",
+        "version": version,
+        "encodings": len(new_uuids),
+        "identities": len(set(new_uuids)),
+        "added": added,
+        "updated": sorted(set(changed) - set(added)),
+        "removed": removed,
+    }), 200
+
+@app.route('/stats')
+def stats():
+    """Recognition pipeline stats as JSON (gallery size, admission queue, batching) for tuning."""
+    body = {
+        "gallery": {"encodings": face_manager.loaded_count(), "version": face_manager.gallery.version},
+        "executor": {"mode": recognition_executor.mode},
+        "admission": admission.stats(),
+        "debug_capture": debug_capture.stats(),
+        "events": event_writer.stats(),
+        "live": live.stats(),
+        "logging": log_pipeline.stats(),
+    }
+    if match_batcher is not None:
+        body["batching"] = match_batcher.stats()
+    if recognition_cache is not None:
+        body["recognition_cache"] = recognition_cache.stats()
+    if frame_gate is not None:
+        body["frame_gate"] = frame_gate.stats()
+    if gallery_sync is not None:
+        body["gallery_sync"] = gallery_sync.stats()
+    return jsonify(body), 200
+
 
 """
 POST /upload-base64
@@ -68,33 +428,206 @@ POST /upload-base64
 """
 
 @app.route('/upload-base64', methods=['POST'])
+@requires_gallery
+@admission.guard
 def upload_base64():
     """
-    Accept JSON { "image": "<base64-or-data-url>", "filename": "optional.png" }
-    or form field 'image' and optional 'filename'.
+    Accept JSON { "image": "<base64-or-data-url>", "filename": "optional.png", "top_k": 1, "device_id": "cam-1" }
+    or form field 'image' and optional 'filename'. The camera is identified by the
+    X-Device-Id header, else "device_id", else the client address.
+    Responds with the closest identity and its distance; with top_k > 1 the
+    nearest distinct identities are listed under "candidates".
     """
     # accept JSON or form
     if request.is_json:
-        payload = request.get_json()
+        with stage("json_parse"):
+            payload = request.get_json()
         base64_str = payload.get('image') if payload else None
+        top_k = payload.get('top_k', 1) if payload else 1
+        device = payload.get('device_id') if payload else None
     else:
         base64_str = request.form.get('image')
+        top_k = request.form.get('top_k', 1)
+        device = request.form.get('device_id')
 
     if not base64_str:
         return jsonify({"error": "No 'image' data provided"}), 400
+    try:
+        top_k = max(1, int(top_k))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid 'top_k'. Must be a positive integer."}), 400
 
-    # result = face_manager.search_image_b64(base64_str)
-    result = face_manager.search_image_b64(base64_str)
-    
-    logging.info("Result: %s", result)
-    if result:
-        return jsonify({"message": "Image processed successfully", "result": result}), 201
-    if not result:
-        return jsonify({"error": "No face detected in image"}), 400
+    try:
+        with stage("base64_decode"):
+            image = decode_base64_image(base64_str)
+    except ImageDecodeError as e:
+        return jsonify({"error": "Invalid image data", "details": str(e)}), 400
+
+    return recognition_response(image, top_k, device)
+
+
+"""
+POST /upload-image
+ - Content-Type: image/jpeg (or any image/*, application/octet-stream): raw image bytes as the body
+ - Content-Type: multipart/form-data: file part named "image" (or the first file part)
+ - Optional query string: ?top_k=3&device_id=cam-1 (or an X-Device-Id header)
+Same response shape as /upload-base64, without the ~33% base64 overhead and JSON parsing.
+"""
+
+@app.route('/upload-image', methods=['POST'])
+@requires_gallery
+@admission.guard
+def upload_image():
+    """Accept a raw or multipart image upload and run recognition on it."""
+    try:
+        top_k = max(1, int(request.args.get('top_k', 1)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid 'top_k'. Must be a positive integer."}), 400
+
+    if request.mimetype == 'multipart/form-data':
+        part = request.files.get('image') or next(iter(request.files.values()), None)
+        if part is None:
+            return jsonify({"error": "No 'image' file part provided"}), 400
+        data = part.read()
+        mime_type = part.mimetype
+    else:
+        # read the body directly, without populating request.form
+        data = request.get_data(cache=False)
+        mime_type = request.mimetype
+
+    try:
+        image = decode_image_bytes(data, mime_type)
+    except ImageDecodeError as e:
+        return jsonify({"error": "Invalid image data", "details": str(e)}), 400
+    return recognition_response(image, top_k, request.args.get('device_id'))
+
+
+def request_device(device=None) -> str:
+    """Camera identity for per-device state: X-Device-Id header, then device_id, then client address."""
+    return request.headers.get('X-Device-Id') or device or request.remote_addr or "unknown"
+
+
+def run_recognition(image, top_k: int, device: str):
+    """
+    Recognition behind the cheap short-circuits, in order: frame-change gate
+    (unchanged scene on this device), result cache (similar recent frame), then
+    the executor.
+    """
+    # read before recognizing, so a result computed against an older gallery is never reused as current
+    version = face_manager.gallery.version
+    if frame_gate is not None:
+        with stage("frame_gate"):
+            matches = frame_gate.check(device, image, top_k, version)
+        FRAME_GATE.inc(result="skipped" if matches is not None else "passed")
+        if matches is not None:
+            return matches
+
+    if recognition_cache is not None:
+        hit = False
+        try:
+            with stage("frame_hash"):
+                hit, matches = recognition_cache.get(device, image, top_k, version)
+        except ImageDecodeError:
+            # not decodable at all; recognition below reports it as "no face"
+            pass
+        RECOGNITION_CACHE.inc(result="hit" if hit else "miss")
+        if hit:
+            return matches
+
+    with stage("recognize"):
+        matches = recognition_executor.recognize(image, top_k=top_k)
+    if frame_gate is not None:
+        frame_gate.record(device, image, top_k, version, matches)
+    if recognition_cache is not None:
+        try:
+            recognition_cache.put(device, image, top_k, version, matches)
+        except ImageDecodeError:
+            pass
+    return matches
+
+
+# last identity published per device, so a camera streaming frames of the same
+# person produces one dashboard update, not one per frame
+_last_published = {}
+
+
+def publish_recognition(device: str, match) -> None:
+    uuid, distance = match
+    if _last_published.get(device) == uuid:
+        return
+    _last_published[device] = uuid
+    live.publish("recognition", {
+        "device": device,
+        "result": uuid,
+        "distance": round(float(distance), 4),
+        "time": datetime.now().strftime("%H:%M:%S"),
+    })
+
+
+def recognition_response(image, top_k: int = 1, device=None):
+    """Run recognition on a decoded image and build the /upload-* JSON response."""
+    device = request_device(device)
+    matches = run_recognition(image, top_k, device)
+    MATCHES.inc(result="matched" if matches else "unmatched")
+    if matches:
+        publish_recognition(device, matches[0])
+    debug_capture.capture(image.data, ext=image.ext, failed=not matches)
+
+    app.logger.info("Result: %s", matches)
+    if matches:
+        uuid, distance = matches[0]
+        body = {"message": "Image processed successfully", "result": uuid, "distance": distance}
+        if top_k > 1:
+            body["candidates"] = [{"result": u, "distance": d} for u, d in matches]
+        return jsonify(body), 201
+    return jsonify({"error": "No face detected in image"}), 400
+
+
+from datetime import date, datetime
+
+"""
+POST /events
+ - Content-Type: application/json
+ - Body JSON: one event, a list of events, or {"events": [...]}
+   event: {"user_id": 3, "volume_ml": 180, "timestamp": "2025-01-01T08:30:00", "device_id": "main-1"}
+   ("name" may replace "user_id"; "timestamp" defaults to now)
+ - 202 {"accepted": n}: queued and written within EVENTS_FLUSH_INTERVAL seconds
+"""
+
+@app.route('/events', methods=['POST'])
+def ingest_events():
+    """Validate hydration events and hand them to the write-behind queue."""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({"error": "Request must be JSON"}), 400
+    if isinstance(payload, dict) and "events" in payload:
+        payload = payload["events"]
+    raw_events = payload if isinstance(payload, list) else [payload]
+    if not raw_events:
+        return jsonify({"error": "No events provided"}), 400
+    if len(raw_events) > app.config['EVENTS_MAX_PER_REQUEST']:
+        return jsonify({"error": f"Too many events (max {app.config['EVENTS_MAX_PER_REQUEST']} per request)"}), 413
+
+    received_at = datetime.now()
+    parsed = []
+    for i, raw in enumerate(raw_events):
+        try:
+            parsed.append(parse_event(raw, received_at))
+        except ValueError as e:
+            return jsonify({"error": "Invalid event", "index": i, "details": str(e)}), 400
+
+    try:
+        accepted = event_writer.submit(parsed)
+    except Overloaded as e:
+        resp = jsonify({"error": "Server busy", "details": e.reason})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(max(1, int(e.retry_after)))
+        return resp
+    return jsonify({"accepted": accepted}), 202
 
-from datetime import datetime
 
 @app.route('/add-user', methods=['POST'])
+@requires_gallery
 def add_user():
     """
     Adds a new user with their daily hydration limit and an array of pains.
@@ -109,7 +642,8 @@ def add_user():
         return jsonify({"error": "Request must be JSON"}), 400
     
     # Avoid logging full base64 image
-    payload = request.get_json()
+    with stage("json_parse"):
+        payload = request.get_json()
     log_payload = payload.copy()
     if 'image' in log_payload:
         log_payload['image'] = '<base64_data_hidden>'
@@ -122,71 +656,56 @@ def add_user():
 
     if not name or not isinstance(name, str) or not name.strip():
         return jsonify({"error": "Invalid or missing 'name'"}), 400
+    name = name.strip()
     if not isinstance(daily_limit, (int, float)) or daily_limit <= 0:
         return jsonify({"error": "Invalid or missing 'daily_limit'. Must be a positive number."}), 400
     # pains is optional but if present must be list
     if pains is not None and not isinstance(pains, list):
         return jsonify({"error": "Invalid 'pains'. Must be an array."}), 400
 
-    # Process Image
-    logging.info("Processing image: %s", type(bb64))
-    uuid = face_manager.detect_faces_b64(bb64)
-    # Explicitly store the image
-    image_path = None
+    # Process Image: decode once, then share the bytes and RGB array between
+    # face encoding and persistence
+    app.logger.debug("Processing image: %s", type(bb64))
+    image = None
     if bb64:
-        m = DATA_URL_RE.match(bb64.strip())
-        mime_type = None
-        base64_payload = None
-        if m:
-            mime_type = m.group(1).lower()
-            base64_payload = m.group(2)
-        else:
-            base64_payload = bb64.strip()
-
-        base64_payload = re.sub(r'\s+', '', base64_payload)
-
         try:
-            image_bytes = base64.b64decode(base64_payload, validate=True)
-        except (BinAsciiError, ValueError) as e:
+            with stage("base64_decode"):
+                image = decode_base64_image(bb64)
+        except ImageDecodeError as e:
             app.logger.error(f"Invalid base64 data for image saving: {e}")
             return jsonify({"error": "Invalid base64 data for image saving", "details": str(e)}), 400
-
-        ext = None
-        if mime_type:
-            if mime_type == 'image/png':
-                ext = 'png'
-            elif mime_type in ('image/jpeg', 'image/jpg'):
-                ext = 'jpg'
-            elif mime_type == 'image/gif':
-                ext = 'gif'
-            elif mime_type == 'image/webp':
-                ext = 'webp'
-
-        if not ext:
-            ext = detect_extension_from_bytes(image_bytes)
-
+    encodings = face_manager.encode_faces(image) if image is not None else []
+    face_found = len(encodings) > 0
+    if image is not None:
+        debug_capture.capture(image.data, ext=image.ext, failed=not face_found)
+    # Explicitly store the image
+    image_path = None
+    if image is not None:
+        ext = image.ext
         if not ext:
             app.logger.error("Could not determine image type for saving.")
             return jsonify({"error": "Could not determine image type for saving"}), 400
 
-        # Use the generated UUID as the filename
         file_name = f"{name}.{ext}"
         # Create a dedicated directory for user images
         user_images_dir = os.path.join(os.getcwd(), "faces")
         os.makedirs(user_images_dir, exist_ok=True)
         image_path = os.path.join(user_images_dir, file_name)
+        if os.path.exists(image_path):
+            # the name is enrolled already; keep that user's photo
+            image_path = os.path.join(user_images_dir, f"{name}-{uuid.uuid4().hex[:8]}.{ext}")
 
         try:
             with open(image_path, 'wb') as f:
-                f.write(image_bytes)
+                f.write(image.data)
         except OSError as e:
             app.logger.error(f"Failed to save image file: {e}")
             return jsonify({"error": "Failed to save image file", "details": str(e)}), 500
     else:
         app.logger.warning("No image data provided for user, image_path will be None.")
 
-    app.logger.info("Face detected with UUID: %s", uuid)
-    if not uuid:
+    app.logger.info("Face detected: %s", face_found)
+    if not face_found:
         return jsonify({"error": "no face found in image"}), 500
 
     daily_limit_ml = daily_limit * 1000
@@ -195,16 +714,47 @@ def add_user():
             INSERT INTO users (name, image_path, daily_limit_ml, created_at)
             VALUES (?, ?, ?, ?);
         """
-        user_id_cursor = db.execute(query, (name.strip(), uuid, daily_limit_ml, datetime.now()))
-        user_id = user_id_cursor.fetchone()[0] if user_id_cursor.fetchone() else user_id_cursor.lastrowid
-        
+        # the user and its quantized encodings are committed together
+        with db.transaction():
+            user_id = db.execute(query, (name, image_path, daily_limit_ml, datetime.now())).lastrowid
+            embedding_store.save(user_id, encodings)
+
+        # Enroll just this identity (as stored, so every process and a reload agree);
+        # the rest of the gallery is untouched
+        encodings = embedding_store.as_stored(encodings)
+        face_manager.add_identity(name, encodings)
+        publish_gallery_change(added={name: encodings})
+
         app.logger.info("User added successfully with ID: %s", user_id)
+        live.publish("user_added", {"user_id": user_id, "name": name})
         return jsonify({"message": "User added successfully", "user_id": user_id}), 201
     except Exception as e:
         app.logger.error(f"Error adding user: {e}")
         return jsonify({"error": "Failed to add user", "details": str(e)}), 500
 
 
+def forget_user_face(name, image_path):
+    """
+    Update the gallery after the user `name` was deleted. Names are not unique: if
+    another user still has the name, the gallery entry becomes that (newest) user's
+    stored encodings, as after a reload; otherwise the identity and its photos go.
+    """
+    encodings = embedding_store.load_name(name)
+    if encodings is not None and len(encodings):
+        face_manager.add_identity(name, encodings)
+        publish_gallery_change(added={name: encodings})
+    else:
+        face_manager.remove_identity(name, delete_files=encodings is None)
+        publish_gallery_change(removed=[name])
+    # the deleted user's own photo, unless another user still points at it
+    if image_path and os.path.isfile(image_path) and \
+            db.fetchone("SELECT 1 FROM users WHERE image_path = ?", (image_path,)) is None:
+        try:
+            os.remove(image_path)
+        except OSError:
+            app.logger.exception("Failed to delete face image %s", image_path)
+
+
 @app.route('/delete-users', methods=['POST'])
 def delete_user_route():
     """
@@ -221,36 +771,105 @@ def delete_user_route():
         return jsonify({"error": "Missing 'user_id'"}), 400
         
     try:
+        user = db.fetchone("SELECT name, image_path FROM users WHERE id = ?", (user_id,))
         delete_user(db, user_id)
+        if user and user.get('name'):
+            forget_user_face(user['name'], user['image_path'])
         app.logger.info(f"User {user_id} deleted successfully")
+        live.publish("user_deleted", {"user_id": user_id})
         return jsonify({"message": "User deleted successfully"}), 200
     except Exception as e:
         app.logger.error(f"Error deleting user: {e}")
         return jsonify({"error": "Failed to delete user", "details": str(e)}), 500
 
 
+DASHBOARD_QUERY = """
+    SELECT u.id, u.name, u.daily_limit_ml, u.created_at,
+           COALESCE(d.total_ml, 0) AS intake_ml,
+           COALESCE(d.event_count, 0) AS event_count,
+           d.last_event, d.last_volume_ml
+    FROM users u
+    LEFT JOIN daily_intake d ON d.user_id = u.id AND d.day = ?
+"""
+
+
+def dashboard_users(user_ids=None):
+    """Users (all, or just `user_ids`) with today's totals from the daily_intake rollup, in one query."""
+    sql, params = DASHBOARD_QUERY, [date.today()]
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        sql += f" WHERE u.id IN ({','.join('?' * len(user_ids))})"
+        params.extend(user_ids)
+    users = db.fetchall(sql + " ORDER BY u.id", params)
+    for user in users:
+        user['intake_liters'] = round(user['intake_ml'] / 1000.0, 2)
+        user['daily_limit_liters'] = (user['daily_limit_ml'] or 0) / 1000.0
+        user['last_event_time'] = user['last_event'].strftime("%H:%M") if user['last_event'] else None
+    return users
+
+
 @app.route('/')
-def index():  
-    # Mock data for the dashboard
+def index():
+    """Dashboard: every user with today's totals; later changes arrive over /stream."""
     system_status = {'online': True}
-    
-    overall = {
-        # 'percent': 65,
-        # 'avg_liters': 1.2,
-        # 'total_liters': 3.6,
-        # 'total_goal_liters': 6.0,
-        # 'last_sync': datetime.now().strftime("%H:%M:%S")
-    }
-    users = db.fetchall("select * from users")
-    app.logger.info("Users: %s", users)
+
+    users = dashboard_users()
+    total_ml = sum(user['intake_ml'] for user in users)
+    goal_ml = sum(user['daily_limit_ml'] or 0 for user in users)
+    last_event = max((user['last_event'] for user in users if user['last_event']), default=None)
+
+    overall = {}
+    if users:
+        overall = {
+            'percent': round(total_ml / goal_ml * 100, 1) if goal_ml else 0,
+            'avg_liters': round(total_ml / len(users) / 1000.0, 2),
+            'total_liters': round(total_ml / 1000.0, 2),
+            'total_goal_liters': round(goal_ml / 1000.0, 2),
+            'last_sync': last_event.strftime("%H:%M:%S") if last_event else None,
+        }
 
     return render_template(
         'index.html',
         system_status=system_status,
         overall=overall,
-        users=users
+        users=users,
+        live_cursor=live.last_id,
     )
 
+
+"""
+GET /stream
+ - Server-Sent Events: "intake" (per-user totals), "recognition", "user_added",
+   "user_deleted", "reset" (reload the page). Resumes from Last-Event-ID, or ?cursor=<id>
+   (the live_cursor the page was rendered with).
+ - 503 when LIVE_MAX_STREAMS dashboards are already streaming; poll instead.
+GET /stream?since=<id>
+ - Returns immediately: {"last_id": n, "events": [{"id", "event", "data"}, ...]}
+   or {"last_id": n, "reset": true}.
+"""
+
+@app.route('/stream')
+def stream():
+    since = request.args.get('since', type=int)
+    if since is not None:
+        cursor, messages = live.poll(since)
+        if messages is None:
+            return jsonify({"last_id": cursor, "reset": True}), 200
+        # messages are already serialized; splice them in instead of re-encoding
+        events = ",".join(f'{{"id":{mid},"event":"{event}","data":{data}}}' for mid, event, data in messages)
+        return Response(f'{{"last_id":{cursor},"events":[{events}]}}', mimetype="application/json")
+
+    if not live.try_open():
+        return jsonify({"error": "Too many live dashboards", "poll": f"/stream?since={live.last_id}"}), 503
+    # resume after the last event this page has seen (page render or previous stream)
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('cursor', type=int)
+    return Response(live.stream(last_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == '__main__':
-    # Run in debug mode for development only
+    # Run in debug mode for development only; use serve.py for production
     app.run(host='0.0.0.0', port=5000, debug=True)
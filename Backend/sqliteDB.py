@@ -1,20 +1,49 @@
 # sqlite_db.py
 import os
 import sqlite3
+import threading
 from contextlib import contextmanager
 from datetime import datetime
-from typing import Any, Iterable, Iterator, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
-from flask import g, current_app
+from flask import g, current_app, has_app_context
+
+from metrics import SQL_ERRORS, SQL_SECONDS
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+def _statement_type(sql: str) -> str:
+    """Leading keyword of a statement ("select", "insert", ...), used as a metrics label."""
+    head = sql.lstrip().split(None, 1)
+    return head[0].lower() if head else "empty"
+
+
+# Applied once per connection when it is opened. cache_size < 0 is in KiB.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",   # durable at WAL checkpoints; no fsync per commit
+    "foreign_keys": "ON",
+    "cache_size": -16000,      # ~16 MB page cache per connection
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
 class SqliteDB:
     """
     Lightweight SQLite manager for Flask apps.
 
+    Connections are long-lived: each app context checks one out of a small pool
+    (returned on teardown) and background threads keep their own, so pragmas are
+    applied once per connection and the sqlite3 prepared-statement cache
+    (`cached_statements`) stays warm across requests.
+
+    Writes made outside transaction() are committed right away; inside it they are
+    committed together when the outermost block exits. Reads never commit.
+    SQL text is only logged (at DEBUG) when `log_sql` is set.
+
     Usage:
       db = SqliteDB("instance/app.db")
       db.init_app(app)
@@ -22,12 +51,31 @@ class SqliteDB:
       # in a request:
       db.execute("INSERT INTO users (name) VALUES (?)", ("alice",))
       rows = db.fetchall("SELECT * FROM users WHERE id = ?", (1,))
+
+      # several writes, one commit:
+      with db.transaction():
+          db.executemany("INSERT INTO hydration_events (...) VALUES (...)", rows)
     """
 
-    def __init__(self, database: str, timeout: float = 5.0, detect_types: int = sqlite3.PARSE_DECLTYPES):
+    def __init__(self, database: str, timeout: float = 5.0, detect_types: int = sqlite3.PARSE_DECLTYPES,
+                 pragmas: Optional[Dict[str, Any]] = None, pool_size: int = 8,
+                 cached_statements: int = 256, log_sql: bool = False):
         self.database = database
         self.timeout = timeout
         self.detect_types = detect_types
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.log_sql = log_sql
+        self._pool: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_conns: List[sqlite3.Connection] = []
+        # bumped by close_all() so per-thread connections opened before it are replaced
+        self._generation = 0
+        self.opened = 0
 
     def init_app(self, app):
         """Attach this manager to a Flask app instance and register teardown."""
@@ -45,62 +93,120 @@ class SqliteDB:
 
         app.teardown_appcontext(self.teardown)
 
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database,
+                               timeout=self.timeout,
+                               detect_types=self.detect_types,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self.opened += 1
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        return self._connect()
+
+    def _checkin(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            # a request that failed half-way must not leak its writes into the next one
+            conn.rollback()
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
     def get_conn(self) -> sqlite3.Connection:
-        """Return a per-request sqlite3.Connection stored on flask.g."""
-        conn = getattr(g, "_sqlite_db_conn", None)
-        if conn is None:
-            conn = sqlite3.connect(self.database,
-                                   timeout=self.timeout,
-                                   detect_types=self.detect_types,
-                                   check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            # sensible pragmas
-            conn.execute("PRAGMA foreign_keys = ON")
-            conn.execute("PRAGMA journal_mode = WAL")
-            g._sqlite_db_conn = conn
+        """
+        Return the connection for the current app context (checked out of the pool
+        and stored on flask.g), or the calling thread's own connection outside one.
+        """
+        if has_app_context():
+            conn = getattr(g, "_sqlite_db_conn", None)
+            if conn is None:
+                conn = g._sqlite_db_conn = self._checkout()
+            return conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            conn = self._local.conn = self._connect()
+            self._local.generation = self._generation
+            with self._pool_lock:
+                self._thread_conns.append(conn)
         return conn
 
     def teardown(self, exc: Optional[BaseException] = None):
-        """Close connection on appcontext teardown."""
+        """Return the app context's connection to the pool on teardown."""
         conn = getattr(g, "_sqlite_db_conn", None)
         if conn is not None:
+            g._sqlite_db_conn = None
+            try:
+                self._checkin(conn)
+            except Exception:
+                logger.exception("Failed to return SQLite connection to the pool")
+
+    def close_all(self) -> None:
+        """Close pooled and per-thread connections (shutdown, tests)."""
+        with self._pool_lock:
+            conns = self._pool + self._thread_conns
+            self._pool, self._thread_conns = [], []
+            self._generation += 1
+        for conn in conns:
             try:
                 conn.close()
             except Exception:
                 pass
-            finally:
-                g._sqlite_db_conn = None
+
+    def _autocommit(self, conn: sqlite3.Connection) -> None:
+        # sqlite3 only opens an implicit transaction for INSERT/UPDATE/DELETE/REPLACE,
+        # so reads fall through without a commit
+        if conn.in_transaction and not getattr(self._local, "depth", 0):
+            conn.commit()
 
     # Basic executors
     def execute(self, sql: str, params: Optional[Iterable[Any]] = None) -> sqlite3.Cursor:
+        op = _statement_type(sql)
         try:
-            logger.info(f"Executing SQL: {sql} | Params: {params}")
-            cur = self.get_conn().execute(sql, tuple(params) if params else ())
-            self.get_conn().commit()
-            logger.info("SQL executed successfully.")
+            if self.log_sql:
+                logger.debug("Executing SQL: %s | Params: %s", sql, params)
+            with SQL_SECONDS.time(op=op):
+                conn = self.get_conn()
+                cur = conn.execute(sql, tuple(params) if params else ())
+                self._autocommit(conn)
             return cur
         except Exception as e:
-            logger.error(f"SQL execution failed: {e}")
+            SQL_ERRORS.inc(op=op)
+            logger.error("SQL execution failed: %s", e)
             raise
 
     def executemany(self, sql: str, seq_of_params: Iterable[Iterable[Any]]) -> sqlite3.Cursor:
+        op = _statement_type(sql)
         try:
-            logger.info(f"Executing Many SQL: {sql}")
-            cur = self.get_conn().executemany(sql, seq_of_params)
-            self.get_conn().commit()
-            logger.info("SQL executemany successful.")
+            if self.log_sql:
+                logger.debug("Executing Many SQL: %s", sql)
+            with SQL_SECONDS.time(op=op + "_many"):
+                conn = self.get_conn()
+                cur = conn.executemany(sql, seq_of_params)
+                self._autocommit(conn)
             return cur
         except Exception as e:
-            logger.error(f"SQL executemany failed: {e}")
+            SQL_ERRORS.inc(op=op + "_many")
+            logger.error("SQL executemany failed: %s", e)
             raise
 
     def executescript(self, sql_script: str) -> None:
         try:
-            logger.info("Executing SQL script.")
-            self.get_conn().executescript(sql_script)
-            logger.info("SQL script executed successfully.")
+            if self.log_sql:
+                logger.debug("Executing SQL script.")
+            with SQL_SECONDS.time(op="script"):
+                self.get_conn().executescript(sql_script)
         except Exception as e:
-            logger.error(f"SQL script execution failed: {e}")
+            SQL_ERRORS.inc(op="script")
+            logger.error("SQL script execution failed: %s", e)
             raise
 
     # Fetch helpers that return dicts
@@ -116,13 +222,20 @@ class SqliteDB:
     # Transaction context manager
     @contextmanager
     def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group writes into one commit; nested blocks join the outermost one."""
         conn = self.get_conn()
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
         try:
             yield conn
-            conn.commit()
+            if depth == 0:
+                conn.commit()
         except Exception:
-            conn.rollback()
+            if depth == 0:
+                conn.rollback()
             raise
+        finally:
+            self._local.depth = depth
 
     # Simple schema initialization
     def init_db(self, schema_path: str) -> None:
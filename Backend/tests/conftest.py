@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# the backend modules are flat files in Backend/, imported by name as server.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The Flask app module, on a temp database and working directory, without warm-up."""
+    workdir = tmp_path_factory.mktemp("server")
+    os.environ["SMARTHYDRATE_DATABASE"] = str(workdir / "app.db")
+    os.environ["SMARTHYDRATE_WARMUP"] = "0"
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import server
+    finally:
+        os.chdir(cwd)
+    return server
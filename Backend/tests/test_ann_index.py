@@ -0,0 +1,58 @@
+import numpy as np
+
+from ann_index import IVFIndex
+from gallery import ENCODING_DIM, FaceGallery
+
+
+def assert_index_consistent(gallery, index):
+    """Every active row is listed exactly once, in the cell and position the index records."""
+    listed = np.concatenate([index._lists[c][:index._list_sizes[c]] for c in range(len(index.centroids))])
+    assert sorted(listed.tolist()) == list(range(len(gallery)))
+    for row in range(len(gallery)):
+        cell, pos = index._cell[row], index._pos[row]
+        assert cell >= 0
+        assert index._lists[cell][pos] == row
+
+
+def test_removes_and_moves_keep_cells_and_positions_consistent():
+    rng = np.random.default_rng(0)
+    gallery = FaceGallery()
+    index = IVFIndex(nlist=8, nprobe=8, min_train_size=64)
+    gallery.attach_index(index)
+    for i in range(100):
+        gallery.add(f"id{i}", rng.normal(size=(rng.integers(1, 3), ENCODING_DIM)))
+    assert index.trained
+
+    for step in range(300):
+        uuid = f"id{rng.integers(120)}"
+        if rng.random() < 0.5:
+            gallery.remove(uuid)
+        else:
+            gallery.add(uuid, rng.normal(size=(rng.integers(1, 3), ENCODING_DIM)))
+        assert_index_consistent(gallery, index)
+
+
+def test_probing_every_cell_matches_exact_search():
+    rng = np.random.default_rng(1)
+    gallery = FaceGallery()
+    gallery.attach_index(IVFIndex(nlist=8, nprobe=8, min_train_size=64))
+    encs = rng.normal(size=(200, ENCODING_DIM)).astype(np.float32)
+    for i, enc in enumerate(encs):
+        gallery.add(f"id{i}", [enc])
+    for i in range(0, 200, 3):
+        gallery.remove(f"id{i}")
+
+    for query in encs[rng.choice(len(encs), 50)] + rng.normal(0, 0.05, (50, ENCODING_DIM)):
+        assert gallery.search(query, tolerance=2.0, top_k=3) == \
+            gallery.search(query, tolerance=2.0, top_k=3, exact=True)
+
+
+def test_bulk_load_retrains_from_scratch():
+    rng = np.random.default_rng(2)
+    gallery = FaceGallery()
+    index = IVFIndex(nlist=4, min_train_size=32)
+    gallery.attach_index(index)
+    gallery.add("a", rng.normal(size=(40, ENCODING_DIM)))
+    gallery.load(rng.normal(size=(10, ENCODING_DIM)), [f"id{i}" for i in range(10)])
+    assert not index.trained
+    assert index.candidates(np.zeros(ENCODING_DIM)) is None
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from events import parse_event
+
+
+def test_parses_a_dispenser_event():
+    received = datetime(2025, 1, 1, 9, 0)
+    assert parse_event({"user_id": 3, "volume_ml": 180, "device_id": "main-1"}, received) == \
+        (3, None, 180.0, received, "main-1")
+    assert parse_event({"name": " alice ", "volume_ml": 50.5, "timestamp": "2025-01-01T08:30:00"})[1:4] == \
+        ("alice", 50.5, datetime(2025, 1, 1, 8, 30))
+
+
+@pytest.mark.parametrize("ts", [1e20, 10 ** 400, float("inf"), float("-inf"), float("nan"), 253402300800,
+                                "9999-12-31T23:59:59-23:00", "yesterday", [1]])
+def test_out_of_range_timestamps_are_client_errors(ts):
+    with pytest.raises(ValueError, match=r"^'timestamp' must be ISO 8601 or Unix seconds$"):
+        parse_event({"user_id": 1, "volume_ml": 100, "timestamp": ts})
+
+
+@pytest.mark.parametrize("volume", [float("nan"), float("inf"), 0, -5, 5001, True, "100"])
+def test_invalid_volumes_are_rejected(volume):
+    with pytest.raises(ValueError, match="volume_ml"):
+        parse_event({"user_id": 1, "volume_ml": volume})
+
+
+@pytest.mark.parametrize("body", ['{"user_id": 1, "volume_ml": 100, "timestamp": 1e20}',
+                                  '{"user_id": 1, "volume_ml": 100, "timestamp": Infinity}',
+                                  '{"user_id": 1, "volume_ml": NaN}'])
+def test_events_route_answers_400(server, body):
+    resp = server.app.test_client().post("/events", data=body, content_type="application/json")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Invalid event"
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from gallery import ENCODING_DIM, FaceGallery
+
+
+def assert_consistent(gallery, expected):
+    """Row bookkeeping matches the rows, and every identity has exactly its encodings."""
+    assert len(gallery) == sum(len(encs) for encs in expected.values())
+    assert sorted(gallery.identities()) == sorted(expected)
+    rows = sorted(row for uuid_rows in gallery._rows.values() for row in uuid_rows)
+    assert rows == list(range(len(gallery)))
+    for uuid, uuid_rows in gallery._rows.items():
+        assert all(gallery.uuids[row] == uuid for row in uuid_rows)
+        got = gallery.matrix[uuid_rows]
+        want = np.asarray(expected[uuid], dtype=np.float32)
+        assert sorted(map(tuple, got)) == sorted(map(tuple, want))
+    assert all(u is None for u in gallery._uuids[len(gallery):])
+
+
+def test_random_adds_replaces_and_removes_keep_rows_consistent():
+    rng = np.random.default_rng(0)
+    gallery = FaceGallery(capacity=4)
+    expected = {}
+    for step in range(500):
+        uuid = f"id{rng.integers(40)}"
+        if rng.random() < 0.35:
+            assert gallery.remove(uuid) == len(expected.pop(uuid, []))
+        else:
+            encs = rng.normal(size=(rng.integers(1, 4), ENCODING_DIM)).astype(np.float32)
+            assert gallery.add(uuid, encs) == len(encs)
+            expected[uuid] = encs
+        assert_consistent(gallery, expected)
+
+
+def test_load_replaces_everything_and_supports_removal():
+    rng = np.random.default_rng(1)
+    gallery = FaceGallery()
+    gallery.add("stale", rng.normal(size=(2, ENCODING_DIM)))
+    matrix = rng.normal(size=(6, ENCODING_DIM)).astype(np.float32)
+    uuids = ["a", "b", "a", "c", "b", "a"]
+    assert gallery.load(matrix, uuids) == 6
+    expected = {u: matrix[[i for i, x in enumerate(uuids) if x == u]] for u in set(uuids)}
+    assert_consistent(gallery, expected)
+
+    gallery.remove("a")
+    del expected["a"]
+    assert_consistent(gallery, expected)
+
+
+def test_load_rejects_mismatched_uuids():
+    with pytest.raises(ValueError):
+        FaceGallery().load(np.zeros((2, ENCODING_DIM)), ["a"])
+
+
+def test_search_finds_nearest_distinct_identities():
+    gallery = FaceGallery()
+    gallery.add("a", [np.zeros(ENCODING_DIM), np.full(ENCODING_DIM, 0.01)])
+    gallery.add("b", [np.full(ENCODING_DIM, 0.02)])
+    gallery.add("far", [np.ones(ENCODING_DIM)])
+    hits = gallery.search(np.zeros(ENCODING_DIM), tolerance=0.6, top_k=3)
+    assert [uuid for uuid, _ in hits] == ["a", "b"]
+    assert gallery.search_batch(np.zeros((1, ENCODING_DIM)), tolerance=0.6, top_k=3)[0][0][0] == "a"
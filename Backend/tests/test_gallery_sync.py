@@ -0,0 +1,82 @@
+import numpy as np
+
+from face import FaceMatcher
+from gallery import ENCODING_DIM
+from gallery_sync import GallerySync, diff_galleries
+
+
+def make_process(tmp_path, name, **options):
+    """One backend process: a matcher with its own gallery, syncing through tmp_path/journal."""
+    matcher = FaceMatcher(faces_dir=str(tmp_path / name), cache_path="", load=False)
+    return matcher, GallerySync(str(tmp_path / "journal"), matcher, **options)
+
+
+def state(matcher):
+    _, matrix, uuids = matcher.snapshot()
+    return {uuid: sorted(map(tuple, matrix[[i for i, u in enumerate(uuids) if u == uuid]]))
+            for uuid in set(uuids)}
+
+
+def encodings(rng, k=1):
+    return rng.normal(size=(k, ENCODING_DIM)).astype(np.float32)
+
+
+def test_changes_reach_the_other_process(tmp_path):
+    rng = np.random.default_rng(0)
+    m1, s1 = make_process(tmp_path, "p1")
+    m2, s2 = make_process(tmp_path, "p2")
+
+    alice = encodings(rng, 2)
+    m1.add_identity("alice", alice)
+    assert s1.publish(added={"alice": alice}) == 1
+    assert s2.poll() == 1
+    assert state(m2) == state(m1)
+
+    m2.remove_identity("alice")
+    s2.publish(removed=["alice"])
+    s1.poll()
+    assert state(m1) == state(m2) == {}
+
+
+def test_colliding_versions_are_claimed_once(tmp_path):
+    rng = np.random.default_rng(1)
+    m1, s1 = make_process(tmp_path, "p1")
+    m2, s2 = make_process(tmp_path, "p2")
+    # both processes see the same newest version and race for the next one
+    s2._scan = lambda: (0, None)
+
+    v1 = s1.publish(added={"alice": encodings(rng)})
+    v2 = s2.publish(added={"bob": encodings(rng)})
+    assert (v1, v2) == (1, 2)
+    s1.poll()
+    assert sorted(state(m1)) == sorted(state(m2)) == ["alice", "bob"]
+
+
+def test_lagging_process_catches_up_from_snapshot(tmp_path):
+    rng = np.random.default_rng(2)
+    m1, s1 = make_process(tmp_path, "p1", snapshot_every=2, keep=2)
+    m2, s2 = make_process(tmp_path, "p2", snapshot_every=2, keep=2)
+
+    for i in range(7):
+        encs = encodings(rng)
+        m1.add_identity(f"id{i}", encs)
+        s1.publish(added={f"id{i}": encs})
+    m1.remove_identity("id3")
+    s1.publish(removed=["id3"])
+    assert not (tmp_path / "journal" / "delta-000000000001.npz").exists()
+
+    s2.poll()
+    assert s2.snapshots_loaded == 1
+    assert s2.version == s1.version == 8
+    assert state(m2) == state(m1)
+
+
+def test_diff_galleries_reports_added_changed_and_removed():
+    a, b, c = (np.full((1, ENCODING_DIM), v, dtype=np.float32) for v in (0.0, 0.1, 0.2))
+    before = (np.concatenate([a, b]), ["alice", "bob"])
+    after = (np.concatenate([c, b, a]), ["alice", "bob", "carol"])
+    changed, created, removed = diff_galleries(before, after)
+    assert sorted(changed) == ["alice", "carol"]
+    assert created == ["carol"]
+    assert removed == []
+    assert diff_galleries(after, before)[2] == ["carol"]
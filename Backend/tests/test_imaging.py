@@ -0,0 +1,40 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from imaging import ImageDecodeError, decode_base64_image
+
+
+def png_b64():
+    buf = BytesIO()
+    Image.fromarray(np.full((8, 8, 3), 200, dtype=np.uint8)).save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+@pytest.mark.parametrize("prefix, mime_type", [
+    ("data:image/png;base64,", "image/png"),
+    ("DATA:image/JPEG;base64,", "image/jpeg"),
+    ("data:image/png;name=face.png;base64,", "image/png"),
+    ("", None),
+])
+def test_image_data_urls_and_bare_base64(prefix, mime_type):
+    image = decode_base64_image(prefix + png_b64())
+    assert image.mime_type == mime_type
+    assert image.rgb.shape == (8, 8, 3)
+
+
+@pytest.mark.parametrize("prefix", ["data:application/octet-stream;base64,", "data:;base64,", "data:,"])
+def test_data_url_without_image_mime_type_is_sniffed(prefix):
+    image = decode_base64_image(prefix + png_b64())
+    assert image.mime_type is None
+    assert image.ext == "png"
+    assert image.rgb.shape == (8, 8, 3)
+
+
+@pytest.mark.parametrize("payload", ["", "data:image/png;base64,", "not base64!"])
+def test_invalid_payloads_raise(payload):
+    with pytest.raises(ImageDecodeError):
+        decode_base64_image(payload)
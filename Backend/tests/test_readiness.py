@@ -0,0 +1,49 @@
+import threading
+
+import face
+from face import FaceMatcher
+
+
+def warming_matcher(monkeypatch, server, tmp_path, load_models):
+    monkeypatch.setattr(face, "load_models", load_models)
+    matcher = FaceMatcher(faces_dir=str(tmp_path / "faces"), cache_path="", load=False)
+    monkeypatch.setattr(server, "face_manager", matcher)
+    return matcher
+
+
+def test_recognition_waits_for_the_models(monkeypatch, server, tmp_path):
+    release = threading.Event()
+    started = []
+    matcher = warming_matcher(monkeypatch, server, tmp_path, lambda: release.wait(10))
+    thread = matcher.warm_up(then=lambda: started.append(True))
+    assert matcher._gallery_loaded.wait(5)
+    client = server.app.test_client()
+
+    # gallery loaded, models still importing
+    assert client.get("/readyz").status_code == 503
+    resp = client.post("/upload-base64", json={"image": "x"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"]
+    assert not matcher.ready and not started
+
+    release.set()
+    thread.join(5)
+    assert matcher.ready and started
+    assert client.get("/readyz").status_code == 200
+
+
+def test_failed_model_load_is_not_ready(monkeypatch, server, tmp_path):
+    def fail():
+        raise ImportError("no dlib")
+
+    started = []
+    matcher = warming_matcher(monkeypatch, server, tmp_path, fail)
+    matcher.warm_up(then=lambda: started.append(True)).join(5)
+    client = server.app.test_client()
+
+    resp = client.get("/readyz")
+    assert resp.status_code == 503
+    assert resp.get_json()["error"] == "ImportError: no dlib"
+    assert client.post("/upload-base64", json={"image": "x"}).status_code == 503
+    assert not matcher.ready and not started
+    assert not matcher.wait_ready(0.01)
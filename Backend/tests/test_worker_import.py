@@ -0,0 +1,26 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def import_server_in_worker():
+    import threading
+
+    import server
+    return {
+        "main_process": server.MAIN_PROCESS,
+        "logging": server.log_pipeline is not None,
+        "gallery_sync": server.gallery_sync is not None,
+        "threads": [t.name for t in threading.enumerate()],
+    }
+
+
+def test_spawned_worker_skips_main_process_setup(monkeypatch, tmp_path):
+    # a worker spawned under `python server.py` re-imports server.py like this
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SMARTHYDRATE_DATABASE", str(tmp_path / "worker.db"))
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        state = pool.submit(import_server_in_worker).result(timeout=60)
+    assert state == {"main_process": False, "logging": False, "gallery_sync": False, "threads": ["MainThread"]}
+    # no migration, log file or journal
+    assert sorted(os.listdir(tmp_path)) == ["faces"]
@@ -0,0 +1,277 @@
+# workers.py
+import os
+import json
+import struct
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from admission import Overloaded
+from gallery import ENCODING_DIM, rank_matches
+from metrics import FACES
+
+logger = logging.getLogger(__name__)
+
+# Control block layout: seq, version, rows, blob_len (int64 each) + segment name
+_HEADER = struct.Struct("<qqqq64s")
+
+
+class SharedGalleryPublisher:
+    """
+    Publishes the gallery into multiprocessing.shared_memory for worker processes.
+
+    Each publish writes the (N,128) float32 matrix and a JSON list of uuids into a
+    fresh data segment, then swaps the small control block to point at it using a
+    seqlock (seq is odd while writing). Readers never see a half-written gallery:
+    they either get the old segment or the new one. The previous data segment is
+    unlinked right away; workers that already mapped it keep a valid mapping until
+    they switch.
+    """
+
+    def __init__(self):
+        self.control = shared_memory.SharedMemory(create=True, size=_HEADER.size)
+        self.control.buf[:_HEADER.size] = b"\0" * _HEADER.size
+        self._segment: Optional[shared_memory.SharedMemory] = None
+        self._seq = 0
+        self.version = -1
+
+    @property
+    def name(self) -> str:
+        return self.control.name
+
+    def publish(self, version: int, matrix: np.ndarray, uuids: List[str]) -> None:
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        blob = json.dumps(list(uuids)).encode("utf8")
+        size = max(1, matrix.nbytes + len(blob))
+        segment = shared_memory.SharedMemory(create=True, size=size)
+        segment.buf[:matrix.nbytes] = matrix.tobytes()
+        segment.buf[matrix.nbytes:matrix.nbytes + len(blob)] = blob
+
+        name = segment.name.encode("ascii")
+        self._seq += 1  # odd: write in progress
+        _HEADER.pack_into(self.control.buf, 0, self._seq, version, len(matrix), len(blob), name)
+        self._seq += 1  # even: consistent
+        _HEADER.pack_into(self.control.buf, 0, self._seq, version, len(matrix), len(blob), name)
+
+        old, self._segment = self._segment, segment
+        self.version = version
+        if old is not None:
+            old.close()
+            old.unlink()
+
+    def close(self) -> None:
+        for shm in (self._segment, self.control):
+            if shm is None:
+                continue
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._segment = None
+
+
+class SharedGalleryReader:
+    """Worker-side view of the published gallery; re-maps only when the version changes."""
+
+    def __init__(self, control_name: str):
+        # spawned workers share the parent's resource tracker, so attaching here does
+        # not schedule an unlink when a worker exits
+        self.control = shared_memory.SharedMemory(name=control_name)
+        self.version = -1
+        self.matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.uuids: List[str] = []
+        self._segment: Optional[shared_memory.SharedMemory] = None
+
+    def _read_header(self):
+        while True:
+            seq, version, rows, blob_len, name = _HEADER.unpack_from(self.control.buf, 0)
+            if seq % 2:
+                continue
+            if _HEADER.unpack_from(self.control.buf, 0)[0] == seq:
+                return version, rows, blob_len, name.rstrip(b"\0").decode("ascii")
+
+    def refresh(self) -> None:
+        while True:
+            version, rows, blob_len, name = self._read_header()
+            if version == self.version or not name:
+                return
+            try:
+                segment = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                # a newer publish unlinked it between reading the header and attaching
+                continue
+            nbytes = rows * ENCODING_DIM * 4
+            matrix = np.ndarray((rows, ENCODING_DIM), dtype=np.float32, buffer=segment.buf[:nbytes])
+            uuids = json.loads(bytes(segment.buf[nbytes:nbytes + blob_len]).decode("utf8"))
+            old = self._segment
+            self.matrix, self.uuids, self._segment, self.version = matrix, uuids, segment, version
+            if old is not None:
+                try:
+                    old.close()
+                except BufferError:
+                    pass
+            return
+
+    def search(self, query: np.ndarray, tolerance: float, top_k: int) -> List[Tuple[str, float]]:
+        self.refresh()
+        if len(self.matrix) == 0:
+            return []
+        diff = self.matrix - np.asarray(query, dtype=np.float32)
+        dists = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        return rank_matches(dists, self.uuids, tolerance, top_k)
+
+
+# --- worker process side ------------------------------------------------------------
+
+_worker_reader: Optional[SharedGalleryReader] = None
+_worker_detection = None
+
+
+def _init_worker(control_name: str, detection) -> None:
+    global _worker_reader, _worker_detection
+    _worker_reader = SharedGalleryReader(control_name)
+    _worker_detection = detection
+    # pay the dlib model load once per worker, not on the first request
+    import face_recognition  # noqa: F401
+
+
+def _recognize(data: bytes, mime_type: Optional[str], tolerance: float,
+               top_k: int) -> Tuple[Optional[bool], List[Tuple[str, float]]]:
+    """
+    Returns (face found, matches); found is None when the image does not decode.
+    Metrics live in the parent process, so the parent counts FACES from `found`.
+    """
+    import face_recognition
+    from detection import detect_faces
+    from imaging import DecodedImage, ImageDecodeError
+
+    try:
+        rgb = DecodedImage(data, mime_type).rgb
+    except ImageDecodeError:
+        return None, []
+    locations = detect_faces(rgb, _worker_detection)
+    if not locations:
+        return False, []
+    encs = face_recognition.face_encodings(rgb, known_face_locations=locations)
+    if not encs:
+        return False, []
+    return True, _worker_reader.search(encs[0], tolerance, top_k)
+
+
+# --- parent side --------------------------------------------------------------------
+
+class RecognitionExecutor:
+    """
+    Runs detection + encoding + matching for recognition requests.
+
+      - mode="inline": in the request thread via FaceMatcher (default); with a
+        `batcher` (batching.MatchBatcher) the gallery matching step is micro-batched
+        with other concurrent requests
+      - mode="process": in a pool of `workers` processes. Workers read the gallery
+        from shared memory (one copy for all of them); any gallery change is
+        republished before the next request is dispatched. A request that times out
+        or finds the pool broken (a worker died) raises admission.Overloaded with
+        `retry_after`; a broken pool is replaced on the next request.
+
+    Usage:
+      executor = RecognitionExecutor(face_manager, mode="process", workers=4)
+      matches = executor.recognize(decoded_image, top_k=1)
+    """
+
+    def __init__(self, matcher, mode: str = "inline", workers: Optional[int] = None,
+                 tolerance: float = 0.6, timeout: Optional[float] = 30.0, batcher=None,
+                 retry_after: float = 2.0):
+        if mode not in ("inline", "process"):
+            raise ValueError(f"Unknown executor mode: {mode!r} (expected 'inline' or 'process')")
+        self.matcher = matcher
+        self.mode = mode
+        self.batcher = batcher
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._publisher: Optional[SharedGalleryPublisher] = None
+        self._publish_lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Start the worker pool (process mode). Called lazily by the first recognize():
+        spawned workers re-import the launching script, so nothing may start
+        processes while a module is merely being imported.
+        """
+        if self.mode != "process" or self._pool is not None:
+            return
+        with self._publish_lock:
+            if self._pool is not None:
+                return
+            self._publisher = SharedGalleryPublisher()
+            version, matrix, uuids = self.matcher.snapshot()
+            self._publisher.publish(version, matrix, uuids)
+            # spawn, not fork: the Flask process has threads and dlib state
+            ctx = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                             initializer=_init_worker,
+                                             initargs=(self._publisher.name, self.matcher.detection))
+        atexit.register(self.shutdown)
+        logger.info("Recognition executor started with %d worker processes", self.workers)
+
+    def _sync_gallery(self) -> None:
+        if self.matcher.gallery.version == self._publisher.version:
+            return
+        with self._publish_lock:
+            version, matrix, uuids = self.matcher.snapshot()
+            if version != self._publisher.version:
+                self._publisher.publish(version, matrix, uuids)
+
+    def recognize(self, image, top_k: int = 1) -> List[Tuple[str, float]]:
+        if self.mode == "inline":
+            if self.batcher is None:
+                return self.matcher.find_matches(image, tolerance=self.tolerance, top_k=top_k)
+            query_enc = self.matcher.encode_query(image)
+            if query_enc is None:
+                return []
+            return self.batcher.match(query_enc, tolerance=self.tolerance, top_k=top_k)
+        self.start()
+        self._sync_gallery()
+        future = None
+        try:
+            future = self._pool.submit(_recognize, image.data, image.mime_type, self.tolerance, top_k)
+            found, matches = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            logger.warning("Recognition timed out after %ss", self.timeout)
+            raise Overloaded("recognition timed out", self.retry_after)
+        except BrokenProcessPool:
+            logger.exception("Recognition worker pool is broken; restarting it")
+            self._reset_pool()
+            raise Overloaded("recognition workers restarting", self.retry_after)
+        if found is not None:
+            FACES.inc(result="found" if found else "not_found")
+        return matches
+
+    def _reset_pool(self) -> None:
+        """Drop a broken pool (and its gallery segment); the next recognize() starts a new one."""
+        with self._publish_lock:
+            pool, self._pool = self._pool, None
+            publisher, self._publisher = self._publisher, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if publisher is not None:
+            publisher.close()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._publisher is not None:
+            self._publisher.close()
+            self._publisher = None